@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# .env читается один раз, до импорта модулей, которые берут настройки из os.getenv
+load_dotenv()
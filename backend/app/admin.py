@@ -1,81 +1,93 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Form
-from sqlalchemy.orm import Session
-from .models import Role, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, exists, delete
+from .models import Role, User, RefreshToken, user_roles
 from .schemas import Token
-from .utils import hash_password
+from .passwords import hash_password_async
 from .database import get_session
 from .dependencies import role_required
+from .roles import role_registry
+from .refresh_tokens import revoke_user_tokens
+from .responses import ORJSONResponse
 
-router = APIRouter(prefix="/admin", tags=["Admin"])
+router = APIRouter(prefix="/admin", tags=["Admin"], default_response_class=ORJSONResponse)
 
+async def count_role_users(session: AsyncSession, role_id: int) -> int:
+    """Количество пользователей с ролью — один запрос по индексу ix_user_roles_role_id"""
+    return await session.scalar(
+        select(func.count()).select_from(user_roles).where(user_roles.c.role_id == role_id)
+    )
 
 
 @router.get("/roles")
-def get_roles(session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    return session.query(Role).all()
+async def get_roles(session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    return (await session.execute(select(Role))).scalars().all()
 
 @router.post("/roles")
-def create_role(name: str = Form(...), session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    if session.query(Role).filter(Role.name == name).first():
+async def create_role(name: str = Form(...), session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    if (await session.execute(select(Role).where(Role.name == name))).scalars().first():
         raise HTTPException(status_code=400, detail="Role already exists")
     role = Role(name=name)
     session.add(role)
-    session.commit()
-    session.refresh(role)
+    await session.commit()
+    role_registry.invalidate()
+    await session.refresh(role)
     return role
 
 @router.put("/roles/{role_id}")
-def update_role(role_id: int, name: str = Form(...), session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    role = session.query(Role).get(role_id)
+async def update_role(role_id: int, name: str = Form(...), session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    role = await session.get(Role, role_id)
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     role.name = name
-    session.commit()
+    await session.commit()
+    role_registry.invalidate()
     return role
 
 @router.delete("/roles/{role_id}")
-def delete_role(role_id: int, session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    role = session.query(Role).get(role_id)
+async def delete_role(role_id: int, session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    role = await session.get(Role, role_id)
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     
     # Проверяем, используется ли эта роль
-    users_with_role = session.query(User).filter(User.role_ids.like(f"%{role_id}%")).all()
-    if users_with_role:
+    role_in_use = await session.scalar(select(exists().where(user_roles.c.role_id == role_id)))
+    if role_in_use:
         raise HTTPException(status_code=403, detail="Cannot delete a role that still has users")
     
-    session.delete(role)
-    session.commit()
+    await session.delete(role)
+    await session.commit()
+    role_registry.invalidate()
     return {"detail": "Deleted"}
 
 
 
 @router.get("/users")
-def get_users(session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    return session.query(User).all()
+async def get_users(session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    return (await session.execute(select(User))).scalars().all()
 
 @router.get("/users/{user_id}")
-def get_user_detail(user_id: int, session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    user_obj = session.query(User).get(user_id)
+async def get_user_detail(user_id: int, session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    user_obj = await session.get(User, user_id)
     if not user_obj:
         raise HTTPException(status_code=404, detail="User not found")
     return user_obj
 
 @router.post("/users")
-def create_user(
+async def create_user(
     email: str = Form(...),
     password: str = Form(...),
     fullname: str = Form(None),
     role_ids: str = Form(...),  # Передаем как строку с разделителями, например "1,2,3"
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     user=Depends(role_required("admin")),
 ):
-    if session.query(User).filter(User.email == email).first():
+    if (await session.execute(select(User).where(User.email == email))).scalars().first():
         raise HTTPException(status_code=400, detail="User already exists")
     
     # Парсим role_ids
     try:
-        role_id_list = [int(rid.strip()) for rid in role_ids.split(",") if rid.strip()]
+        role_id_list = list(dict.fromkeys(int(rid.strip()) for rid in role_ids.split(",") if rid.strip()))
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid role_ids format")
     
@@ -83,45 +95,41 @@ def create_user(
         raise HTTPException(status_code=400, detail="At least one role is required")
     
     # Проверяем существование всех ролей
-    db_roles = session.query(Role).filter(Role.id.in_(role_id_list)).all()
+    db_roles = (await session.execute(select(Role).where(Role.id.in_(role_id_list)))).scalars().all()
     if len(db_roles) != len(role_id_list):
         raise HTTPException(status_code=400, detail="One or more roles do not exist")
     
-    password_hash = hash_password(password)
-    new_user = User(email=email, fullname=fullname, password_hash=password_hash, role_ids=role_ids)
+    password_hash = await hash_password_async(password)
+    new_user = User(email=email, fullname=fullname, password_hash=password_hash)
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await new_user.set_roles(session, role_id_list)
+    await session.commit()
+    await session.refresh(new_user)
     return new_user
 
 @router.put("/users/{user_id}")
-def update_user(
+async def update_user(
     user_id: int,
     email: str = Form(None),
     password: str = Form(None),
     fullname: str = Form(None),
     role_ids: str = Form(None),  # Передаем как строку с разделителями, например "1,2,3"
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     user=Depends(role_required("admin")),
 ):
-    user_obj = session.query(User).get(user_id)
+    user_obj = await session.get(User, user_id)
     if not user_obj:
         raise HTTPException(status_code=404, detail="User not found")
 
     # нельзя убрать роль admin у последнего админа
-    admin_role = session.query(Role).filter(Role.name == "admin").first()
-    if admin_role:
-        current_role_ids = user_obj.get_role_ids_list()
-        has_admin_role = admin_role.id in current_role_ids
+    admin_role = (await session.execute(select(Role).where(Role.name == "admin"))).scalars().first()
+    if admin_role and role_ids is not None and await user_obj.has_role(session, admin_role.id):
+        admin_count = await count_role_users(session, admin_role.id)
         
-        # Считаем всех админов
-        all_users = session.query(User).all()
-        admin_count = sum(1 for u in all_users if admin_role.id in u.get_role_ids_list())
-        
-        if has_admin_role and admin_count == 1 and role_ids is not None:
+        if admin_count == 1:
             # Парсим новые роли
             try:
-                role_id_list = [int(rid.strip()) for rid in role_ids.split(",") if rid.strip()]
+                role_id_list = list(dict.fromkeys(int(rid.strip()) for rid in role_ids.split(",") if rid.strip()))
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid role_ids format")
             
@@ -133,44 +141,46 @@ def update_user(
     if fullname is not None:
         user_obj.fullname = fullname
     if password is not None:
-        user_obj.password_hash = hash_password(password)
+        user_obj.password_hash = await hash_password_async(password)
+        # Смена пароля завершает все сессии пользователя
+        await revoke_user_tokens(session, user_id)
     if role_ids is not None:
         try:
-            role_id_list = [int(rid.strip()) for rid in role_ids.split(",") if rid.strip()]
+            role_id_list = list(dict.fromkeys(int(rid.strip()) for rid in role_ids.split(",") if rid.strip()))
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid role_ids format")
         
         if not role_id_list:
             raise HTTPException(status_code=400, detail="At least one role is required")
         
-        db_roles = session.query(Role).filter(Role.id.in_(role_id_list)).all()
+        db_roles = (await session.execute(select(Role).where(Role.id.in_(role_id_list)))).scalars().all()
         if len(db_roles) != len(role_id_list):
             raise HTTPException(status_code=400, detail="One or more roles do not exist")
         
-        user_obj.role_ids = role_ids
+        await user_obj.set_roles(session, role_id_list)
 
-    session.commit()
+    await session.commit()
+    # updated_at выставляется на стороне БД — перечитываем, чтобы вернуть актуальные данные
+    await session.refresh(user_obj)
     return user_obj
 
 @router.delete("/users/{user_id}")
-def delete_user(user_id: int, session: Session = Depends(get_session), user=Depends(role_required("admin"))):
-    user_obj = session.query(User).get(user_id)
+async def delete_user(user_id: int, session: AsyncSession = Depends(get_session), user=Depends(role_required("admin"))):
+    user_obj = await session.get(User, user_id)
     if not user_obj:
         raise HTTPException(status_code=404, detail="User not found")
 
     # нельзя удалить последнего админа
-    admin_role = session.query(Role).filter(Role.name == "admin").first()
-    if admin_role:
-        current_role_ids = user_obj.get_role_ids_list()
-        has_admin_role = admin_role.id in current_role_ids
-        
-        # Считаем всех админов
-        all_users = session.query(User).all()
-        admin_count = sum(1 for u in all_users if admin_role.id in u.get_role_ids_list())
+    admin_role = (await session.execute(select(Role).where(Role.name == "admin"))).scalars().first()
+    if admin_role and await user_obj.has_role(session, admin_role.id):
+        admin_count = await count_role_users(session, admin_role.id)
         
-        if has_admin_role and admin_count == 1:
+        if admin_count == 1:
             raise HTTPException(403, detail="Cannot delete last admin")
 
-    session.delete(user_obj)
-    session.commit()
+    # Явно чистим связи: в SQLite внешние ключи (ON DELETE CASCADE) по умолчанию выключены
+    await session.execute(delete(user_roles).where(user_roles.c.user_id == user_id))
+    await session.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
+    await session.delete(user_obj)
+    await session.commit()
     return {"detail": "Deleted"}
\ No newline at end of file
@@ -1,33 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Request, Response, BackgroundTasks
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from jose import JWTError, jwt
-from .utils import verify_password, create_access_token, create_refresh_token, SECRET_KEY, ALGORITHM
+from .utils import create_access_token, password_needs_rehash, SECRET_KEY, ALGORITHM
+from .passwords import verify_password_async, rehash_password
+from .roles import role_registry
+from .rate_limit import (login_ip_limit, login_ip_email_limit, login_email_limit,
+                         refresh_ip_limit, refresh_user_limit, client_ip, email_key)
+from .refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_family, revoke_user_tokens
+from .dependencies import get_current_user
 from .schemas import Token
-from .models import User
+from .responses import ORJSONResponse
+from .models import User, RefreshToken
 from .database import get_session
 
-router = APIRouter(prefix="/auth", tags=["Auth"])
+router = APIRouter(prefix="/auth", tags=["Auth"], default_response_class=ORJSONResponse)
 
 @router.post("/login")
-def login(
+async def login(
+    request: Request,
     response: Response,
-    session: Session = Depends(get_session),
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
     email: str = Form(...),
     password: str = Form(...),
 ):
+    # Лимиты по адресу — до запроса к БД и bcrypt: перебор паролей упирается в 429, а не в CPU сервиса
+    ip = client_ip(request)
+    account = email_key(email)
+    await login_ip_limit.hit(ip)
+    await login_ip_email_limit.hit(f"{ip}:{account}")
 
-    user = session.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+    user = (await session.execute(select(User).where(User.email == email))).scalars().first()
+    # Возвращаем соединение в пул на время bcrypt, иначе шквал логинов займёт весь пул
+    if user:
+        session.expunge(user)
+    await session.rollback()
+    # bcrypt выполняется в отдельном пуле процессов (см. passwords.py)
+    if not user or not await verify_password_async(password, user.password_hash):
+        # Общий лимит аккаунта — только за неверный пароль и только после проверки:
+        # пустое ведро не мешает войти владельцу
+        await login_email_limit.hit(account)
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    # Верный пароль не расходует лимит аккаунта с этого адреса
+    await login_ip_email_limit.refund(f"{ip}:{account}")
+    if password_needs_rehash(user.password_hash):
+        background_tasks.add_task(rehash_password, user.id, password, user.password_hash)
     
-    # Получаем имена ролей из ID
-    roles = user.get_roles(session)
-    role_names = [role.name for role in roles]
+    # Имена ролей берём из справочника в памяти — без запроса к БД
+    role_ids = user.get_role_ids_list()
+    await role_registry.ensure_loaded()
+    role_names = role_registry.names(role_ids)
     
-    access_token = create_access_token({"user_id": user.id, "roles": role_names})
-    refresh_token = create_refresh_token({"user_id": user.id, "roles": role_names})
+    claims = {"user_id": user.id, "roles": role_names, "role_ids": role_ids}
+    access_token = create_access_token(claims)
+    # Новая сессия входа — новое семейство refresh-токенов
+    refresh_token = issue_refresh_token(session, claims)
+    await session.commit()
 
     # токены в заголовках ответа
     response.headers["Authorization"] = f"Bearer {access_token}"
@@ -42,20 +72,56 @@ def login(
     
 
 @router.post("/refresh")
-def refresh_token_func(response: Response, refresh_token: str = Form(...)):
+async def refresh_token_func(
+    request: Request,
+    response: Response,
+    refresh_token: str = Form(...),
+    session: AsyncSession = Depends(get_session),
+):
+    await refresh_ip_limit.hit(client_ip(request))
 
-    try:
-        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    payload = decode_refresh_token(refresh_token)
+    await refresh_user_limit.hit(str(payload.get("user_id")))
 
-    user_id = payload.get("user_id")
-    roles = payload.get("roles", [])
-    access_token = create_access_token({"user_id": user_id, "roles": roles})
-    new_refresh_token = create_refresh_token({"user_id": user_id, "roles": roles})
+    # Старый токен помечается использованным; роли — актуальные из БД, а не из токена
+    family, user = await rotate_refresh_token(session, payload)
+    role_ids = user.get_role_ids_list()
+    await role_registry.ensure_loaded()
+    claims = {"user_id": user.id, "roles": role_registry.names(role_ids), "role_ids": role_ids}
+    access_token = create_access_token(claims)
+    new_refresh_token = issue_refresh_token(session, claims, family=family)
+    await session.commit()
 
     # обновлённые токены в заголовках
     response.headers["Authorization"] = f"Bearer {access_token}"
     response.headers["X-Refresh-Token"] = new_refresh_token
 
-   
\ No newline at end of file
+
+@router.post("/logout")
+async def logout(refresh_token: str = Form(...), session: AsyncSession = Depends(get_session)):
+    """Завершает сессию входа: отзывает refresh-токен и все выпущенные из него"""
+    payload = decode_refresh_token(refresh_token)
+    token = await session.get(RefreshToken, payload.get("jti") or "")
+    if token is not None:
+        await revoke_family(session, token.family, payload.get("exp"))
+        await session.commit()
+    return {"detail": "Logged out"}
+
+
+@router.post("/logout-all")
+async def logout_all(user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    """Выход на всех устройствах: отзывает все refresh-токены пользователя.
+    Выданные access-токены действуют до истечения своего срока"""
+    await revoke_user_tokens(session, user["user_id"])
+    await session.commit()
+    return {"detail": "Logged out everywhere"}
+
+
+def decode_refresh_token(refresh_token: str) -> dict:
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return payload
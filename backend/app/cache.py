@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | sqlite | redis
+CACHE_URL = os.getenv("CACHE_URL", "")  # путь к файлу SQLite или redis://host:port/db
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "softstudio:")
+PROJECT_CACHE_SIZE = int(os.getenv("PROJECT_CACHE_SIZE", "512"))
+PROJECT_CACHE_TTL = float(os.getenv("PROJECT_CACHE_TTL", "300"))  # секунды
+# Сколько проектов первой страницы списка загрузить в кэш при старте воркера (0 — не прогревать)
+PROJECT_CACHE_WARM = int(os.getenv("PROJECT_CACHE_WARM", "20"))
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением по размеру и времени жизни записей.
+    Живёт в памяти одного процесса: при нескольких воркерах используйте sqlite или redis"""
+
+    blocking = False  # только блокировка потока, без ввода-вывода
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Счётчик инвалидаций: значение, прочитанное до запроса в БД, не должно
+        # перезаписать кэш, если между чтением и записью данные успели измениться
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteCache:
+    """Кэш в файле SQLite, общий для всех воркеров на одном хосте.
+    Значения хранятся в JSON. При переполнении вытесняются записи, ближайшие к истечению TTL"""
+
+    blocking = True  # запись ждёт блокировку файла до timeout
+
+    def __init__(self, path: str, maxsize: int = 512, ttl: float = 300, prefix: str = ""):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = threading.local()
+        # Счётчики считаются в рамках процесса; размер — общий
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._schema_ready = False
+
+    def _create_schema(self, conn):
+        with _Transaction(conn):
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_expires_at ON cache_entry (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('generation', 0)")
+        self._schema_ready = True
+
+    def _conn(self):
+        # Файл открывается при первом обращении, а не при импорте. Соединение, унаследованное
+        # через fork (gunicorn --preload), не используется — у процесса своё
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            if not self._schema_ready:
+                self._create_schema(conn)
+        return conn
+
+    def _connect(self):
+        return _Transaction(self._conn())
+
+    def generation(self) -> int:
+        return self._conn().execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()[0]
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entry WHERE key = ?", (self.prefix + key,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        if self.maxsize <= 0:
+            return
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            if generation is not None:
+                current = conn.execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()[0]
+                if current != generation:
+                    return
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)",
+                (self.prefix + key, payload, now + (self.ttl if ttl is None else ttl)),
+            )
+            conn.execute("DELETE FROM cache_entry WHERE expires_at <= ?", (now,))
+            overflow = conn.execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0] - self.maxsize
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache_entry WHERE key IN "
+                    "(SELECT key FROM cache_entry ORDER BY expires_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+
+    def invalidate(self, key):
+        with self._connect() as conn:
+            conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+            conn.execute("DELETE FROM cache_entry WHERE key = ?", (self.prefix + key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+            conn.execute("DELETE FROM cache_entry WHERE key LIKE ?", (self.prefix + "%",))
+
+    def stats(self) -> dict:
+        size = self._conn().execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT вокруг соединения, чтобы проверка поколения и запись были атомарны"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class RedisCache:
+    """Кэш в Redis (или любом сервере с протоколом Redis). Вытеснение по памяти — на стороне
+    сервера (maxmemory-policy), TTL выставляется на каждую запись"""
+
+    blocking = True  # синхронный клиент ждёт ответа сервера
+
+    def __init__(self, url: str, ttl: float = 300, prefix: str = "", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis требует пакет redis (pip install redis)")
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._generation_key = prefix + "generation"
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        return int(self.client.get(self._generation_key) or 0)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        from redis import WatchError
+
+        payload = json.dumps(value, ensure_ascii=False)
+        ttl_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key)
+                if generation is not None and int(pipe.get(self._generation_key) or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.set(self.prefix + key, payload, px=ttl_ms)
+                pipe.execute()
+            except WatchError:
+                # Поколение сменилось во время записи — значит данные уже устарели
+                return
+
+    def invalidate(self, key):
+        with self.client.pipeline() as pipe:
+            pipe.incr(self._generation_key)
+            pipe.delete(self.prefix + key)
+            pipe.execute()
+
+    def clear(self):
+        self.client.incr(self._generation_key)
+        keys = [k for k in self.client.scan_iter(match=self.prefix + "*") if k != self._generation_key.encode()]
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class AsyncCache:
+    """Интерфейс кэша для асинхронных обработчиков. Методы бэкендов с вводом-выводом (sqlite, redis)
+    выполняются в пуле потоков: медленный Redis или занятый файл не останавливают цикл событий воркера"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def _call(self, method, *args, **kwargs):
+        if self.backend.blocking:
+            return await run_in_threadpool(method, *args, **kwargs)
+        return method(*args, **kwargs)
+
+    async def generation(self) -> int:
+        return await self._call(self.backend.generation)
+
+    async def get(self, key):
+        return await self._call(self.backend.get, key)
+
+    async def set(self, key, value, generation: int = None, ttl: float = None):
+        await self._call(self.backend.set, key, value, generation=generation, ttl=ttl)
+
+    async def invalidate(self, key):
+        await self._call(self.backend.invalidate, key)
+
+    async def clear(self):
+        await self._call(self.backend.clear)
+
+    async def stats(self) -> dict:
+        return await self._call(self.backend.stats)
+
+
+def create_cache(backend: str = CACHE_BACKEND, url: str = CACHE_URL,
+                 maxsize: int = PROJECT_CACHE_SIZE, ttl: float = PROJECT_CACHE_TTL, prefix: str = CACHE_PREFIX,
+                 client=None):
+    """Создаёт кэш по имени бэкенда. В многопроцессном режиме (несколько воркеров uvicorn)
+    используйте sqlite или redis: инвалидация удаляет запись из общего хранилища,
+    поэтому её видят все воркеры. client — готовый клиент Redis (общий пул соединений, тесты)"""
+    if backend == "memory":
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    if backend == "sqlite":
+        path = url or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "cache.sqlite3")
+        return SQLiteCache(path, maxsize=maxsize, ttl=ttl, prefix=prefix)
+    if backend == "redis":
+        return RedisCache(url, ttl=ttl, prefix=prefix, client=client)
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+def project_key(project_id: int) -> str:
+    return f"project:{project_id}"
+
+
+# Кэш сериализованных полных проектов для GET /api/projects/{id}
+project_cache = AsyncCache(create_cache())
@@ -0,0 +1,89 @@
+"""
+Сжатие ответов: brotli, если клиент его принимает и установлен пакет brotli, иначе gzip.
+
+Ответы меньше COMPRESSION_MINIMUM_SIZE, картинки, уже сжатые ответы (Content-Encoding задан,
+например .br/.gz из uploads) и Range-ответы не трогаются. ETag сжатого ответа становится
+слабым: байты на проводе отличаются от исходного представления.
+"""
+import os
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+
+from .http_cache import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+# Уровни подобраны под динамические ответы: выше — заметно дороже по CPU при малом выигрыше
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = COMPRESSION_BROTLI_QUALITY,
+                 thread_minimum_size: int = 128 * 1024, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self.thread_minimum_size = thread_minimum_size
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if len(body) >= self.thread_minimum_size:
+            # Как у GZipResponder: большой кусок, сжатый прямо в цикле событий, задержит остальные запросы
+            return await run_in_threadpool(self._compress_body, body, more_body)
+        return self._compress_body(body, more_body)
+
+    def _compress_body(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE, compresslevel: int = COMPRESSION_GZIP_LEVEL,
+                 brotli_quality: int = COMPRESSION_BROTLI_QUALITY, **kwargs):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel, **kwargs)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        except ValueError:
+            accepted = set()
+        options = {"exclude_content_types": self.exclude_content_types}
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(
+                self.app, self.minimum_size, quality=self.brotli_quality,
+                thread_minimum_size=self.thread_minimum_size, **options,
+            )
+        elif "gzip" in accepted:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel,
+                thread_minimum_size=self.thread_minimum_size, **options,
+            )
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, **options)
+
+        async def send_weak_etag(message):
+            # Сжали мы сами (а не отдали готовый .br/.gz) — сильный ETag больше не описывает байты
+            if message["type"] == "http.response.start" and not responder.content_encoding_set:
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get("etag")
+                if "content-encoding" in headers and etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+            await send(message)
+
+        await responder(scope, receive, send_weak_etag)
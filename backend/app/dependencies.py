@@ -1,24 +1,64 @@
+import hashlib
+import os
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from app.utils import SECRET_KEY, ALGORITHM
+from app.roles import role_registry
+from app.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+# Кэш проверенных токенов: админка шлёт пачки запросов с одним токеном, и проверка
+# подписи JWT выполняется один раз. Запись живёт до exp токена, но не дольше TOKEN_CACHE_MAX_TTL
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "300"))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_MAX_TTL)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Ключ — дайджест, чтобы не держать сами токены в памяти
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached
+    user, exp = decode_access_token(token)
+    ttl = TOKEN_CACHE_MAX_TTL if exp is None else min(TOKEN_CACHE_MAX_TTL, exp - time.time())
+    if ttl > 0:
+        token_cache.set(digest, user, ttl=ttl)
+    return user
+
+def decode_access_token(token: str):
+    """Проверяет подпись и срок токена, возвращает (данные пользователя, exp)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Без типа или с другим типом (refresh-токен) — не access-токен
+        if payload.get("type") != "access":
+            raise HTTPException(status_code=401, detail="Invalid token")
         user_id = int(payload.get("user_id"))
         roles = payload.get("roles", [])
+        role_ids = payload.get("role_ids")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        return {"user_id": user_id, "roles": roles}
+        # Множества строятся один раз на токен, проверка роли — O(1)
+        return {
+            "user_id": user_id,
+            "roles": roles,
+            "role_names": frozenset(roles),
+            "role_ids": frozenset(role_ids) if role_ids is not None else None,
+        }, payload.get("exp")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def role_required(required_role: str):
-    def dependency(user = Depends(get_current_user)):
-        if required_role not in user["roles"]:
+    async def dependency(user = Depends(get_current_user)):
+        if user["role_ids"] is not None:
+            # В новых токенах есть ID ролей: сверяем по ID, имя разрешаем через справочник
+            await role_registry.ensure_loaded()
+            allowed = role_registry.id_for(required_role) in user["role_ids"]
+        else:
+            allowed = required_role in user["role_names"]
+        if not allowed:
             raise HTTPException(status_code=403, detail="Not enough permissions")
         return user
-    return dependency
\ No newline at end of file
+    return dependency
@@ -0,0 +1,337 @@
+"""
+Производные изображения для srcset: уменьшенные копии в WebP/AVIF.
+
+Генерация идёт в отдельном пуле процессов после сохранения проекта и не задерживает
+ответ. Файлы лежат рядом с оригиналом в uploads/variants/<путь оригинала без расширения>/
+вместе с manifest.json, а готовый набор записывается в таблицу image_variants. Сериализация
+берёт варианты из памяти воркера (load_variants подгружает их из БД одним запросом на ответ)
+и в горячем пути не трогает диск.
+
+Досоздать варианты для уже загруженных картинок и перенести в БД готовые манифесты:
+    python -m app.images
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+
+from .cache import TTLCache
+from .database import SessionLocal
+from .models import ImageVariants
+from .uploads import UPLOADS_DIR
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = os.path.join(UPLOADS_DIR, "variants")
+VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",") if w.strip()]
+VARIANT_FORMATS = [f.strip() for f in os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp").split(",") if f.strip()]
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+# Сколько задач может ждать в очереди; лишние пропускаются и досоздаются командой python -m app.images
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", "200"))
+# Сколько картинок держать в памяти воркера. Набор вариантов для пути не меняется,
+# поэтому записи живут долго; картинки без вариантов перепроверяются в БД раз в IMAGE_VARIANTS_MISS_TTL
+# и сразу, как только у проекта выросла версия вариантов
+IMAGE_VARIANTS_CACHE_SIZE = int(os.getenv("IMAGE_VARIANTS_CACHE_SIZE", "50000"))
+IMAGE_VARIANTS_MISS_TTL = float(os.getenv("IMAGE_VARIANTS_MISS_TTL", "30"))
+FORMAT_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+# путь оригинала -> список вариантов
+_variants = TTLCache(maxsize=IMAGE_VARIANTS_CACHE_SIZE, ttl=24 * 3600)
+# путь оригинала -> variants_version проекта, при котором в БД вариантов не было
+_misses = TTLCache(maxsize=IMAGE_VARIANTS_CACHE_SIZE, ttl=IMAGE_VARIANTS_MISS_TTL)
+
+
+def variants_dir_for(rel_path: str) -> str:
+    return os.path.join(VARIANTS_DIR, os.path.splitext(rel_path)[0])
+
+
+def is_safe_path(rel_path) -> bool:
+    """Путь картинок этапов и результата приходит от клиента в JSON: "../" или абсолютный путь
+    увели бы Pillow и makedirs за пределы uploads. Принимаем только канонический путь к файлу
+    внутри uploads (не в variants/) — такой, какой возвращает store_upload"""
+    if not rel_path or os.path.isabs(rel_path):
+        return False
+    uploads = os.path.realpath(UPLOADS_DIR)
+    source = os.path.realpath(os.path.join(uploads, rel_path))
+    if os.path.commonpath([source, uploads]) != uploads or source == uploads:
+        return False
+    if os.path.relpath(source, uploads).replace(os.sep, "/") != rel_path:
+        return False
+    return not rel_path.startswith(os.path.relpath(VARIANTS_DIR, UPLOADS_DIR) + "/")
+
+
+def generate_variants(rel_path: str) -> list:
+    """Выполняется в процессе пула: создаёт варианты и manifest.json, возвращает их список.
+    Если варианты уже созданы (файл загружен повторно), возвращает готовый manifest.json"""
+    from PIL import Image, features
+
+    if not is_safe_path(rel_path):
+        raise ValueError(f"Недопустимый путь изображения: {rel_path!r}")
+    source = os.path.join(UPLOADS_DIR, rel_path)
+    target_dir = variants_dir_for(rel_path)
+    try:
+        with open(os.path.join(target_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    os.makedirs(target_dir, exist_ok=True)
+
+    variants = []
+    with Image.open(source) as img:
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+        # Не увеличиваем: ширины больше оригинала заменяются одной копией в исходном размере
+        widths = sorted({min(w, img.width) for w in VARIANT_WIDTHS})
+        for width in widths:
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            for fmt in VARIANT_FORMATS:
+                if not features.check(fmt):
+                    continue
+                name = f"{width}.{fmt}"
+                tmp_path = os.path.join(target_dir, f".{name}.part")
+                resized.save(tmp_path, format=fmt.upper(), **FORMAT_OPTIONS.get(fmt, {}))
+                os.replace(tmp_path, os.path.join(target_dir, name))
+                variants.append({
+                    "width": width,
+                    "height": height,
+                    "format": fmt,
+                    "url": os.path.relpath(os.path.join(target_dir, name), UPLOADS_DIR).replace("\\", "/"),
+                })
+
+    manifest_tmp = os.path.join(target_dir, ".manifest.json.part")
+    with open(manifest_tmp, "w") as f:
+        json.dump(variants, f)
+    os.replace(manifest_tmp, os.path.join(target_dir, "manifest.json"))
+    return variants
+
+
+def get_variants(rel_path):
+    """Готовые варианты для картинки или пустой список. Только память: перед сериализацией
+    варианты нужно подгрузить через load_variants"""
+    if not rel_path:
+        return []
+    return _variants.get(rel_path) or []
+
+
+def _needs_load(path, version: int) -> bool:
+    if not path or _variants.get(path) is not None:
+        return False
+    # Промах запомнен при меньшей версии вариантов — mark_variants_ready другого воркера
+    # мог записать варианты и сдвинуть версию (а с ней ETag): перепроверяем, иначе тело без
+    # вариантов ушло бы под новым ETag и осталось у клиентов и в общем кэше проектов
+    missed_at = _misses.get(path)
+    return missed_at is None or missed_at < version
+
+
+async def load_variants(session, images):
+    """Подгружает из image_variants варианты картинок, которых ещё нет в памяти воркера.
+    images — пары (путь, variants_version проекта)"""
+    versions = {}
+    for path, version in images:
+        if _needs_load(path, version or 0):
+            versions[path] = max(versions.get(path, 0), version or 0)
+    todo = list(versions)
+    # Кусками: у SQLite ограничено число параметров запроса
+    for start in range(0, len(todo), 500):
+        chunk = todo[start:start + 500]
+        rows = dict((await session.execute(
+            select(ImageVariants.path, ImageVariants.variants).where(ImageVariants.path.in_(chunk))
+        )).all())
+        for path in chunk:
+            if path in rows:
+                _variants.set(path, json.loads(rows[path]))
+            else:
+                _misses.set(path, versions[path])
+
+
+async def save_variants(results: dict):
+    """Записывает готовые наборы вариантов (путь -> список) в image_variants и в память воркера"""
+    if not results:
+        return
+    async with SessionLocal() as session:
+        existing = set((await session.execute(
+            select(ImageVariants.path).where(ImageVariants.path.in_(list(results)))
+        )).scalars().all())
+        rows = [{"path": path, "variants": json.dumps(variants)}
+                for path, variants in results.items() if path not in existing]
+        if rows:
+            try:
+                await session.execute(insert(ImageVariants), rows)
+                await session.commit()
+            except IntegrityError:
+                # Ту же картинку одновременно записал другой воркер — набор вариантов у них одинаковый
+                await session.rollback()
+    for path, variants in results.items():
+        _variants.set(path, variants)
+
+
+def has_variants(rel_path) -> bool:
+    return os.path.exists(os.path.join(variants_dir_for(rel_path), "manifest.json"))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=IMAGE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def shutdown_executor(executor: ProcessPoolExecutor = None):
+    """Останавливает пул. С executor — только если это всё ещё текущий пул"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and executor in (None, _executor):
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def schedule_variants(paths, on_done=None):
+    """Ставит генерацию вариантов в очередь, не дожидаясь результата. Перед вызовом
+    варианты путей должны быть подгружены через load_variants.
+    on_done(results) вызывается в основном процессе, когда пакет обработан и хотя бы одна картинка
+    получила варианты; results — словарь путь -> список вариантов"""
+    global _pending
+    # Варианты, уже записанные в БД, — в памяти после load_variants; остальные (в том числе
+    # готовые на диске, но без записи в БД) отдаются пулу, он не пересоздаёт существующие файлы.
+    # Известные варианты сверяем с диском: их мог удалить uploads_gc, пока запись жила
+    # в памяти воркера, а повторная загрузка того же файла даёт тот же путь
+    paths = [p for p in dict.fromkeys(paths) if is_safe_path(p)]
+    for path in paths:
+        if get_variants(path) and not has_variants(path):
+            # До пересоздания отдаём картинку без srcset, а не ссылки на удалённые файлы
+            _variants.invalidate(path)
+    paths = [p for p in paths if not get_variants(p)]
+    if not paths:
+        return
+    if _pending + len(paths) > IMAGE_QUEUE_LIMIT:
+        logger.warning("Очередь вариантов изображений переполнена, пропущено файлов: %d", len(paths))
+        return
+
+    loop = asyncio.get_running_loop()
+    remaining = len(paths)
+    results = {}
+    _pending += remaining
+
+    def done(future, path, executor):
+        nonlocal remaining
+        global _pending
+        _pending -= 1
+        remaining -= 1
+        exc = None if future.cancelled() else future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            # Процесс пула убит — сломанный пул больше не принимает задачи, следующий вызов создаст новый
+            shutdown_executor(executor)
+        if future.cancelled() or exc is not None:
+            logger.warning("Не удалось создать варианты для %s: %s", path, exc)
+        else:
+            results[path] = future.result()
+        if remaining == 0 and results and on_done is not None:
+            on_done(results)
+
+    for path in paths:
+        executor = get_executor()
+        try:
+            future = loop.run_in_executor(executor, generate_variants, path)
+        except BrokenProcessPool:
+            shutdown_executor(executor)
+            executor = get_executor()
+            future = loop.run_in_executor(executor, generate_variants, path)
+        future.add_done_callback(lambda f, p=path, e=executor: done(f, p, e))
+
+
+def stats() -> dict:
+    return {"workers": IMAGE_WORKERS, "queue_limit": IMAGE_QUEUE_LIMIT, "pending": _pending}
+
+
+async def referenced_paths() -> list:
+    from sqlalchemy import union_all
+    from .models import Project, ProjectStage, ProjectResultImage
+
+    async with SessionLocal() as session:
+        columns = union_all(
+            select(Project.preview_img.label("path")),
+            select(Project.main_img),
+            select(Project.notebook_img),
+            select(ProjectStage.img),
+            select(ProjectResultImage.img),
+        ).subquery()
+        return (await session.execute(select(columns.c.path).distinct().where(columns.c.path.isnot(None)))).scalars().all()
+
+
+async def bump_variants_version():
+    """Новые варианты меняют ответы API: сдвигаем версию вариантов (и ETag) у всех проектов"""
+    from sqlalchemy import update
+    from .models import Project
+
+    async with SessionLocal() as session:
+        # updated_at передаём явно, иначе сработает onupdate и изменится Last-Modified
+        await session.execute(update(Project).values(
+            variants_version=Project.variants_version + 1, updated_at=Project.updated_at,
+        ))
+        await session.commit()
+
+
+async def import_manifests(paths=None) -> int:
+    """Переносит в image_variants наборы из manifest.json, которых ещё нет в БД"""
+    paths = paths if paths is not None else await referenced_paths()
+    async with SessionLocal() as session:
+        known = set((await session.execute(select(ImageVariants.path))).scalars().all())
+    results = {}
+    for path in paths:
+        if path in known or not is_safe_path(path):
+            continue
+        try:
+            with open(os.path.join(variants_dir_for(path), "manifest.json")) as f:
+                results[path] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    await save_variants(results)
+    if results:
+        await bump_variants_version()
+    return len(results)
+
+
+async def backfill():
+    paths = await referenced_paths()
+    print(f"Из manifest.json перенесено в БД: {await import_manifests(paths)}")
+
+    todo = [p for p in paths if is_safe_path(p) and not has_variants(p) and os.path.exists(os.path.join(UPLOADS_DIR, p))]
+    print(f"Картинок: {len(paths)}, без вариантов: {len(todo)}")
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(get_executor(), generate_variants, p) for p in todo),
+        return_exceptions=True,
+    )
+    failed = [(p, r) for p, r in zip(todo, results) if isinstance(r, Exception)]
+    for path, exc in failed:
+        print(f"  ! {path}: {exc}")
+    ready = {p: r for p, r in zip(todo, results) if not isinstance(r, Exception)}
+    await save_variants(ready)
+    if ready:
+        await bump_variants_version()
+    print(f"Готово: {len(ready)}, ошибок: {len(failed)}")
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -1,38 +1,167 @@
-from fastapi import FastAPI, Depends
+import asyncio
+import io
+import time
+import tokenize
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, APIRouter, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text
-from .database import get_session
-from fastapi.staticfiles import StaticFiles
-from .projects import router as projects_router
+from .database import get_session, engine, pool_stats, env_bool
+from .cache import project_cache
+from .roles import role_registry
+from .dependencies import role_required
+from .projects import router as projects_router, warm_project_cache
+from .project_transfer import router as project_transfer_router
+from .search import router as search_router
 from .auth import router as auth_router
 from .admin import router as admin_router
+from . import passwords, images, metrics, rate_limit, refresh_tokens
+from .uploads import RequestSizeLimitMiddleware, ensure_upload_dirs, UPLOADS_DIR
+from .uploads_static import UploadsStaticFiles
+from .compression import CompressionMiddleware
 
-app = FastAPI(title="105 SOFT STUDIO Backend",
-    description="MAIN SITE API FOR WORK DATABASE",
-    version="1.0.8"
-    )
+# Прогрев воркера при старте: соединение с БД, справочник ролей, кэш проектов
+STARTUP_WARMUP = env_bool("STARTUP_WARMUP", True)
+# /health/*, /metrics и /cache/stats раскрывают устройство сервиса — по умолчанию только для admin.
+# true — если прокси (nginx) закрывает их от внешнего мира, а Prometheus опрашивает без токена
+OPS_ENDPOINTS_PUBLIC = env_bool("OPS_ENDPOINTS_PUBLIC", False)
+
+debug_router = APIRouter(tags=["Debug"])
+ops_router = APIRouter(tags=["Debug"], dependencies=[] if OPS_ENDPOINTS_PUBLIC else [Depends(role_required("admin"))])
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # В продакшене лучше заменить на ["https://105dev.online"]
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["Authorization", "X-Refresh-Token"],
-)
-
-@app.get("/tables", summary="Список таблиц БД", description="Выводит названия всех таблиц БД", tags=["Debug"])
-def get_tables(session=Depends(get_session)):
-    result = session.execute(text(
+@debug_router.get("/tables", summary="Список таблиц БД", description="Выводит названия всех таблиц БД")
+async def get_tables(session=Depends(get_session)):
+    result = await session.execute(text(
         "SELECT tablename FROM pg_catalog.pg_tables WHERE schemaname='public'"
     ))
     tables = [row[0] for row in result.fetchall()]
     return {"tables": tables}
 
-app.include_router(projects_router, prefix="/api", tags=["Projects"])
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@ops_router.get("/health/db", summary="Состояние БД", description="Проверка соединения и статистика пула соединений")
+async def health_db():
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        # Текст ошибки драйвера может содержать хост и DSN — только в лог
+        print(f"Проверка соединения с БД не удалась: {e!r}")
+        return JSONResponse(status_code=503, content={"status": "error", "detail": "Database unavailable", **pool_stats()})
+    return {"status": "ok", **pool_stats()}
+
+@ops_router.get("/health/passwords", summary="Пул bcrypt", description="Загрузка пула процессов для хэширования паролей")
+async def health_passwords():
+    return passwords.stats()
+
+@ops_router.get("/health/images", summary="Пул изображений", description="Очередь генерации уменьшенных копий изображений")
+async def health_images():
+    return images.stats()
+
+@ops_router.get("/health/rate-limit", summary="Лимиты авторизации", description="Настройки лимитов login/refresh и число отказов 429")
+async def health_rate_limit():
+    # У sqlite-хранилища подсчёт ключей — запрос к файлу
+    return await run_in_threadpool(rate_limit.stats)
+
+@ops_router.get("/health/refresh-tokens", summary="Отозванные refresh-токены", description="Кэш отозванных jti и отметок «выйти везде» в памяти воркера")
+async def health_refresh_tokens():
+    return refresh_tokens.stats()
+
+@ops_router.get("/metrics", summary="Метрики", description="Время ответа, время в БД и число SQL-запросов по маршрутам в формате Prometheus",
+                response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@ops_router.get("/cache/stats", summary="Статистика кэша", description="Счётчики попаданий/промахов/вытеснений кэша проектов")
+async def get_cache_stats():
+    return {"projects": await project_cache.stats()}
+
+async def warm_routes(app: FastAPI):
+    """FastAPI собирает таблицы маршрутов подключённых роутеров при первом запросе к ним.
+    Прогоняем через роутер запрос, который не совпадёт ни с одним маршрутом, — он обходит их все"""
+    scope = {"type": "http", "method": "GET", "path": "/__warmup__", "raw_path": b"/__warmup__",
+             "root_path": "", "query_string": b"", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app.router(scope, receive, send)
+    # При первом вызове эндпоинта FastAPI читает его исходник через inspect (для текста ошибок),
+    # а tokenize один раз на процесс компилирует свои регулярные выражения — это ~60 мс
+    list(tokenize.generate_tokens(io.StringIO("pass\n").readline))
+
+async def warm_up(app: FastAPI):
+    """Первые запросы к воркеру не должны платить за разбор маршрутов, пустой пул соединений,
+    справочник ролей и холодный кэш. Ошибка не мешает старту: БД может подняться позже приложения"""
+    started = time.perf_counter()
+    await warm_routes(app)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await role_registry.ensure_loaded()
+        warmed = await warm_project_cache()
+    except Exception as e:
+        print(f"Прогрев при старте пропущен: {e}")
+        return
+    print(f"✓ Прогрев за {(time.perf_counter() - started) * 1000:.0f} мс (проектов в кэше: {warmed})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Всё, что трогает диск и БД, — здесь, в воркере, а не при импорте модулей
+    ensure_upload_dirs()
+    if STARTUP_WARMUP:
+        await warm_up(app)
+    compaction = None
+    if refresh_tokens.REFRESH_TOKEN_COMPACT_INTERVAL > 0:
+        compaction = asyncio.create_task(refresh_tokens.compact_periodically())
+    yield
+    if compaction is not None:
+        compaction.cancel()
+        with suppress(asyncio.CancelledError):
+            await compaction
+    passwords.shutdown_executor()
+    images.shutdown_executor()
+    await engine.dispose()
+
+def create_app() -> FastAPI:
+    """Собирает приложение. Ни импорт, ни сборка не открывают соединений и не создают файлов —
+    это делает lifespan уже в воркере, поэтому app.main можно импортировать до fork (gunicorn --preload)"""
+    app = FastAPI(title="105 SOFT STUDIO Backend",
+        description="MAIN SITE API FOR WORK DATABASE",
+        version="1.0.8",
+        lifespan=lifespan,
+        )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # В продакшене лучше заменить на ["https://105dev.online"]
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Authorization", "X-Refresh-Token"],
+    )
+    app.add_middleware(RequestSizeLimitMiddleware)
+    # Последним — чтобы сжимать ответы всех остальных слоёв
+    app.add_middleware(CompressionMiddleware)
+    # Снаружи всех слоёв: в замер попадает и сжатие
+    if metrics.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+
+    app.include_router(debug_router)
+    app.include_router(ops_router)
+    # До projects_router: иначе /projects/export и /projects/search перехватит маршрут /projects/{project_id}
+    app.include_router(project_transfer_router, prefix="/api", tags=["Projects"])
+    app.include_router(search_router, prefix="/api", tags=["Projects"])
+    app.include_router(projects_router, prefix="/api", tags=["Projects"])
+    # check_dir=False: каталог создаёт lifespan, его отсутствие при импорте — не ошибка
+    app.mount("/uploads", UploadsStaticFiles(directory=UPLOADS_DIR, check_dir=False), name="uploads")
 
-app.include_router(auth_router, prefix="/api")
+    app.include_router(auth_router, prefix="/api")
 
-app.include_router(admin_router, prefix="/api")
+    app.include_router(admin_router, prefix="/api")
+    return app
 
+app = create_app()
@@ -0,0 +1,213 @@
+"""
+Стоимость запросов: время ответа, время в БД и число SQL-запросов.
+
+SQL считают обработчики событий движка SQLAlchemy, запрос целиком — MetricsMiddleware.
+Текущий счётчик лежит в ContextVar: SQLAlchemy выполняет драйвер в greenlet с контекстом
+вызывающей задачи, так что запросы попадают в счётчик того HTTP-запроса, который их сделал.
+
+Наружу данные выходят двумя путями:
+  - заголовок Server-Timing каждого ответа (видно во вкладке Network браузера);
+  - GET /metrics в текстовом формате Prometheus, агрегаты по маршрутам с момента старта процесса
+    (у каждого воркера uvicorn свои счётчики — Prometheus опрашивает их по отдельности).
+
+Для проверок в бенчмарках и скриптах:
+
+    with track_queries() as stats:
+        await fetch_project_page(session, fields, 20)
+    assert stats.statements <= 2
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Mount
+
+from .database import engine, env_bool, IS_PRODUCTION
+
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+# Server-Timing раскрывает внутреннее устройство (сколько запросов к БД) — в продакшене по умолчанию выключен
+SERVER_TIMING = env_bool("SERVER_TIMING", not IS_PRODUCTION)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+# Метка для запросов мимо всех маршрутов: путь как есть дал бы неограниченное число рядов
+UNMATCHED_ROUTE = "unmatched"
+
+
+class QueryStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    """Считает SQL-запросы внутри блока (в текущей задаче asyncio)"""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is None or not started:
+        return
+    stats.db_time += time.perf_counter() - started.pop()
+    stats.statements += 1
+
+
+class _RouteMetrics:
+    __slots__ = ("requests", "duration_sum", "duration_buckets", "db_time", "statements", "statement_buckets")
+
+    def __init__(self):
+        self.requests = {}  # status -> count
+        self.duration_sum = 0.0
+        self.duration_buckets = [0] * len(DURATION_BUCKETS)
+        self.db_time = 0.0
+        self.statements = 0
+        self.statement_buckets = [0] * len(STATEMENT_BUCKETS)
+
+
+_routes = {}  # (method, route) -> _RouteMetrics
+
+
+def _observe(buckets, bounds, value):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[i] += 1
+
+
+def record(method: str, route: str, status: int, duration: float, stats: QueryStats):
+    metrics = _routes.get((method, route))
+    if metrics is None:
+        metrics = _routes[(method, route)] = _RouteMetrics()
+    metrics.requests[status] = metrics.requests.get(status, 0) + 1
+    metrics.duration_sum += duration
+    _observe(metrics.duration_buckets, DURATION_BUCKETS, duration)
+    metrics.db_time += stats.db_time
+    metrics.statements += stats.statements
+    _observe(metrics.statement_buckets, STATEMENT_BUCKETS, stats.statements)
+
+
+def route_label(scope) -> str:
+    """Шаблон маршрута (/api/projects/{project_id}), а не конкретный путь"""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return UNMATCHED_ROUTE
+    if isinstance(route, Mount):
+        return template
+    # route.path роутера, подключённого через include_router, может не содержать prefix —
+    # берём его из начала фактического пути (столько сегментов, сколько не покрывает шаблон)
+    segments = scope["path"].rstrip("/").split("/")
+    prefix = segments[:max(len(segments) - len(template.rstrip("/").split("/")), 0) + 1]
+    return "/".join(prefix) + template if len(prefix) > 1 else template
+
+
+def server_timing(duration: float, stats: QueryStats) -> str:
+    return (f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"')
+
+
+class MetricsMiddleware:
+    """Меряет каждый HTTP-запрос: Server-Timing в ответ и агрегаты для /metrics"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+        with track_queries() as stats:
+
+            async def timed_send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    if self.server_timing:
+                        # Для потоковых ответов — время до начала отдачи тела
+                        headers = MutableHeaders(raw=message["headers"])
+                        headers.append("Server-Timing", server_timing(time.perf_counter() - started, stats))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, timed_send)
+            finally:
+                record(scope["method"], route_label(scope), status, time.perf_counter() - started, stats)
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram(lines, name, labels, buckets, bounds, count, total):
+    # _observe уже считает накопительно: значение попадает во все корзины с le >= value
+    for bound, value in zip(bounds, buckets):
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {value}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total}")
+    lines.append(f"{name}_count{_labels(**labels)} {count}")
+
+
+def render() -> str:
+    """Все счётчики в текстовом формате Prometheus (text/plain; version=0.0.4)"""
+    lines = [
+        "# HELP http_requests_total HTTP requests by route and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route), metrics in sorted(_routes.items()):
+        for status, count in sorted(metrics.requests.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    lines += [
+        "# HELP http_request_duration_seconds Wall time of HTTP requests.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), metrics in sorted(_routes.items()):
+        _histogram(lines, "http_request_duration_seconds", {"method": method, "route": route},
+                   metrics.duration_buckets, DURATION_BUCKETS, sum(metrics.requests.values()), metrics.duration_sum)
+
+    lines += [
+        "# HELP http_request_db_statements SQL statements per HTTP request.",
+        "# TYPE http_request_db_statements histogram",
+    ]
+    for (method, route), metrics in sorted(_routes.items()):
+        _histogram(lines, "http_request_db_statements", {"method": method, "route": route},
+                   metrics.statement_buckets, STATEMENT_BUCKETS, sum(metrics.requests.values()), metrics.statements)
+
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in SQL statements.",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    for (method, route), metrics in sorted(_routes.items()):
+        lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {metrics.db_time}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    _routes.clear()
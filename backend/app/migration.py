@@ -1,19 +1,21 @@
-from sqlalchemy import text, inspect
+import asyncio
+from sqlalchemy import text, inspect, select, insert, exists
 from .database import engine
-from .models import Base
+from .models import Base, Role, User, user_roles
+from .search import create_search_index, rebuild_search_index
+from .images import import_manifests
 
-def create_tables():
+async def create_tables():
     """Создает все таблицы в базе данных на основе моделей SQLAlchemy"""
-    inspector = inspect(engine)
-    
-    # Проверяем, существует ли таблица users
-    table_exists = inspector.has_table("users")
-    
+    async with engine.connect() as conn:
+        # Проверяем, существует ли таблица users
+        table_exists = await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("users"))
+
     if table_exists:
         # Проверяем структуру таблицы users для PostgreSQL
-        with engine.connect() as conn:
+        async with engine.connect() as conn:
             # Проверяем наличие колонки role_id (старая структура)
-            result = conn.execute(text("""
+            result = await conn.execute(text("""
                 SELECT COUNT(*) as cnt 
                 FROM information_schema.columns 
                 WHERE table_name = 'users' AND column_name = 'role_id'
@@ -21,7 +23,7 @@ def create_tables():
             has_old_role_id = result.scalar() > 0
             
             # Проверяем наличие колонки role_ids (новая структура)
-            result = conn.execute(text("""
+            result = await conn.execute(text("""
                 SELECT COUNT(*) as cnt 
                 FROM information_schema.columns 
                 WHERE table_name = 'users' AND column_name = 'role_ids'
@@ -33,7 +35,7 @@ def create_tables():
                 print("Обнаружена старая структура таблицы users. Выполняется миграция...")
                 
                 # Создаем новую таблицу
-                conn.execute(text("""
+                await conn.execute(text("""
                     CREATE TABLE users_new (
                         id SERIAL PRIMARY KEY,
                         email VARCHAR NOT NULL UNIQUE,
@@ -44,27 +46,122 @@ def create_tables():
                         updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
                     )
                 """))
-                conn.commit()
+                await conn.commit()
                 
                 # Копируем данные, преобразуя role_id в строку
-                conn.execute(text("""
+                await conn.execute(text("""
                     INSERT INTO users_new (id, email, password_hash, fullname, role_ids, created_at, updated_at)
                     SELECT id, email, password_hash, fullname, CAST(role_id AS TEXT), created_at, updated_at
                     FROM users
                     WHERE role_id IS NOT NULL
                 """))
-                conn.commit()
+                await conn.commit()
                 
                 # Удаляем старую таблицу и переименовываем новую
-                conn.execute(text("DROP TABLE users"))
-                conn.execute(text("ALTER TABLE users_new RENAME TO users"))
-                conn.commit()
+                await conn.execute(text("DROP TABLE users"))
+                await conn.execute(text("ALTER TABLE users_new RENAME TO users"))
+                await conn.commit()
                 
                 print("✓ Миграция таблицы users завершена успешно!")
     
     # Создаем все таблицы (или обновляем существующие)
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("✓ Все таблицы созданы/обновлены")
 
+    await migrate_columns()
+    await migrate_indexes()
+    await migrate_user_roles()
+    await migrate_search_index()
+    await migrate_image_variants()
+
+async def migrate_columns():
+    """Добавляет в существующие таблицы новые колонки моделей (create_all создаёт только новые таблицы).
+    Только колонки, которые можно добавить без данных: NULL или со значением по умолчанию"""
+    def add_missing(sync_conn):
+        inspector = inspect(sync_conn)
+        added = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                default = column.server_default.arg if column.server_default is not None else None
+                # Выражения вроде now() и NOT NULL без значения по умолчанию — только вручную
+                if default is not None and not isinstance(default, str) or default is None and not column.nullable:
+                    print(f"  ! {table.name}.{column.name}: добавьте колонку вручную")
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"
+                if default is not None:
+                    ddl += f" DEFAULT '{default}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                sync_conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+        return added
+
+    async with engine.begin() as conn:
+        added = await conn.run_sync(add_missing)
+    print(f"✓ Колонки проверены, добавлено: {', '.join(added) if added else 'нет'}")
+
+async def migrate_image_variants():
+    """Переносит в image_variants варианты картинок, созданные до появления таблицы (manifest.json на диске)"""
+    imported = await import_manifests()
+    print(f"✓ Варианты картинок перенесены в БД: {imported}")
+
+async def migrate_indexes():
+    """Создаёт индексы из моделей, которых нет в существующих таблицах (create_all добавляет индексы только новым таблицам)"""
+    def create_missing(sync_conn):
+        inspector = inspect(sync_conn)
+        created = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(sync_conn)
+                    created.append(index.name)
+        return created
+
+    async with engine.begin() as conn:
+        created = await conn.run_sync(create_missing)
+    print(f"✓ Индексы проверены, создано: {', '.join(created) if created else 'нет'}")
+
+async def migrate_search_index():
+    """Создаёт таблицу полнотекстового поиска и заполняет её, если она только что появилась"""
+    async with engine.begin() as conn:
+        if await create_search_index(conn):
+            await rebuild_search_index(conn)
+            print("✓ Индекс полнотекстового поиска создан и заполнен")
+
+async def migrate_user_roles():
+    """Переносит роли из строки users.role_ids в таблицу user_roles.
+    Обрабатываются только пользователи без записей в user_roles, поэтому повторный запуск безопасен"""
+    async with engine.begin() as conn:
+        existing_roles = set((await conn.execute(select(Role.id))).scalars().all())
+        users = (await conn.execute(
+            select(User.id, User.role_ids).where(
+                ~exists().where(user_roles.c.user_id == User.id)
+            )
+        )).all()
+
+        rows = []
+        for user_id, role_ids in users:
+            for rid in dict.fromkeys((role_ids or "").split(",")):
+                rid = rid.strip()
+                if not rid.isdigit():
+                    continue
+                if int(rid) not in existing_roles:
+                    print(f"  ! Пользователь {user_id}: роль {rid} не существует, пропущена")
+                    continue
+                rows.append({"user_id": user_id, "role_id": int(rid)})
+
+        if rows:
+            await conn.execute(insert(user_roles), rows)
+    print(f"✓ Роли пользователей перенесены в user_roles (пользователей: {len(users)}, связей: {len(rows)})")
+
 if __name__ == "__main__":
-    create_tables()
\ No newline at end of file
+    asyncio.run(create_tables())
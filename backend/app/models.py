@@ -6,7 +6,13 @@ from sqlalchemy import (
     TIMESTAMP,
     ForeignKey,
     UniqueConstraint,
-    func
+    Table,
+    Index,
+    func,
+    select,
+    delete,
+    insert,
+    exists
 )
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -16,6 +22,8 @@ Base = declarative_base()
 class Project(Base):
 
     __tablename__ = "project"
+    # Порядок списка и keyset-пагинации: ORDER BY created_at, id
+    __table_args__ = (Index("ix_project_created_at_id", "created_at", "id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String)
@@ -27,6 +35,9 @@ class Project(Base):
     task = Column(Text)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Растёт, когда готовы варианты картинок проекта: входит в ETag, но не в Last-Modified —
+    # содержимое проекта от этого не меняется
+    variants_version = Column(Integer, nullable=False, server_default="0")
     
     about_company = relationship(
         "ProjectAboutCompany",
@@ -34,10 +45,12 @@ class Project(Base):
         back_populates="project",
         cascade="all, delete-orphan"
     )
+    # Порядок по id: update_project сопоставляет пришедшие этапы/прогресс/картинки со строками по позиции
     stages = relationship(
         "ProjectStage",
         back_populates="project",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        order_by="ProjectStage.id",
     )
     result = relationship(
         "ProjectResult",
@@ -48,7 +61,8 @@ class Project(Base):
     progresses = relationship(
         "ProjectProgress",
         back_populates="project",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        order_by="ProjectProgress.id",
     )
 
 
@@ -68,7 +82,7 @@ class ProjectStage(Base):
     __tablename__ = "project_stage"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    project_id = Column(Integer, ForeignKey("project.id", ondelete="CASCADE"))
+    project_id = Column(Integer, ForeignKey("project.id", ondelete="CASCADE"), index=True)
     title = Column(String)
     description = Column(Text)
     img = Column(Text)
@@ -88,7 +102,8 @@ class ProjectResult(Base):
     images = relationship(
         "ProjectResultImage",
         back_populates="result",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        order_by="ProjectResultImage.id",
     )
 
 
@@ -96,18 +111,28 @@ class ProjectResultImage(Base):
     __tablename__ = "project_result_image"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    result_id = Column(Integer, ForeignKey("project_result.id", ondelete="CASCADE"))
+    result_id = Column(Integer, ForeignKey("project_result.id", ondelete="CASCADE"), index=True)
     type = Column(String)  
     img = Column(Text)
 
     result = relationship("ProjectResult", back_populates="images")
 
 
+class ImageVariants(Base):
+    """Готовые варианты картинки (см. images.py). Ключ — путь оригинала в uploads: он адресуется
+    по содержимому, поэтому набор вариантов для пути не меняется"""
+    __tablename__ = "image_variants"
+
+    path = Column(String, primary_key=True)
+    variants = Column(Text, nullable=False)  # JSON: [{"width", "height", "format", "url"}, ...]
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
 class ProjectProgress(Base):
     __tablename__ = "project_progress"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    project_id = Column(Integer, ForeignKey("project.id", ondelete="CASCADE"))
+    project_id = Column(Integer, ForeignKey("project.id", ondelete="CASCADE"), index=True)
     text = Column(String)
     digit = Column(Integer)
 
@@ -115,6 +140,17 @@ class ProjectProgress(Base):
 
 
 
+# Связь пользователей и ролей (N:M). Первичный ключ (user_id, role_id) покрывает
+# выборку ролей пользователя, отдельный индекс по role_id — поиск пользователей роли
+user_roles = Table(
+    "user_roles",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("role_id", Integer, ForeignKey("roles.id", ondelete="RESTRICT"), primary_key=True),
+    Index("ix_user_roles_role_id", "role_id"),
+)
+
+
 class Role(Base):
     __tablename__ = "roles"
     id = Column(Integer, primary_key=True)
@@ -126,7 +162,9 @@ class User(Base):
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(Text, nullable=False)
     fullname = Column(String)
-    role_ids = Column(String, nullable=False)  # Храним ID ролей через запятую, например: "1,2,3"
+    # ID ролей через запятую, например: "1,2,3". Источник истины — таблица user_roles,
+    # строка поддерживается в синхронном состоянии для обратной совместимости API
+    role_ids = Column(String, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -140,9 +178,41 @@ class User(Base):
         """Устанавливает роли из списка integers"""
         self.role_ids = ",".join(str(rid) for rid in role_id_list)
     
-    def get_roles(self, session):
+    async def set_roles(self, session, role_id_list):
+        """Заменяет роли пользователя в user_roles и в строке role_ids"""
+        role_id_list = list(dict.fromkeys(role_id_list))
+        self.set_role_ids_list(role_id_list)
+        if self.id is None:
+            await session.flush()
+        await session.execute(delete(user_roles).where(user_roles.c.user_id == self.id))
+        if role_id_list:
+            await session.execute(
+                insert(user_roles),
+                [{"user_id": self.id, "role_id": rid} for rid in role_id_list],
+            )
+
+    async def get_roles(self, session):
         """Получает объекты Role для данного пользователя"""
-        role_id_list = self.get_role_ids_list()
-        if not role_id_list:
-            return []
-        return session.query(Role).filter(Role.id.in_(role_id_list)).all()
\ No newline at end of file
+        result = await session.execute(
+            select(Role).join(user_roles, user_roles.c.role_id == Role.id).where(user_roles.c.user_id == self.id)
+        )
+        return result.scalars().all()
+
+    async def has_role(self, session, role_id) -> bool:
+        return await session.scalar(
+            select(exists().where(user_roles.c.user_id == self.id, user_roles.c.role_id == role_id))
+        )
+
+class RefreshToken(Base):
+    """Выданный refresh-токен. При обновлении старый помечается used_at и выдаётся новый
+    из того же семейства (family); повторное предъявление использованного токена отзывает всё семейство"""
+    __tablename__ = "refresh_tokens"
+
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family = Column(String(32), nullable=False, index=True)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # По expires_at удаляются просроченные записи (compact_refresh_tokens)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    used_at = Column(TIMESTAMP(timezone=True))
+    revoked_at = Column(TIMESTAMP(timezone=True))
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from .database import SessionLocal
+from .models import User
+from .utils import hash_password, verify_password
+
+# bcrypt считается в отдельных процессах: это CPU-работа на сотни миллисекунд,
+# которая иначе занимает event loop или общий пул потоков всех эндпоинтов
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# Сколько операций может одновременно выполняться или ждать в очереди; остальные получают 503
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "32"))
+PASSWORD_RETRY_AFTER = os.getenv("PASSWORD_RETRY_AFTER", "1")
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+rejected = 0
+restarts = 0
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: форк процесса с запущенным event loop и потоками небезопасен
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def shutdown_executor(executor: ProcessPoolExecutor = None):
+    """Останавливает пул. С executor — только если это всё ещё текущий пул
+    (его мог уже заменить другой запрос, наткнувшийся на ту же поломку)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and executor in (None, _executor):
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": PASSWORD_RETRY_AFTER},
+    )
+
+
+async def _run(func, *args):
+    global _in_flight, rejected, restarts
+    if _in_flight >= PASSWORD_QUEUE_LIMIT:
+        rejected += 1
+        raise _busy()
+    _in_flight += 1
+    executor = get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # Процесс пула убит (OOM killer, segfault) — сломанный пул больше не принимает задачи.
+        # Сбрасываем его, следующий вызов создаст новый
+        shutdown_executor(executor)
+        restarts += 1
+        raise _busy()
+    finally:
+        _in_flight -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def rehash_password(user_id: int, plain_password: str, old_hash: str):
+    """Фоновый перехэш после входа (например, при смене BCRYPT_ROUNDS).
+    Выполняется после отправки ответа и не участвует в задержке логина"""
+    try:
+        new_hash = await hash_password_async(plain_password)
+    except HTTPException:
+        # Пул перегружен — перехэшируем при следующем входе
+        return
+    async with SessionLocal() as session:
+        # Условие на старый хэш: не затираем пароль, если его успели сменить
+        await session.execute(
+            update(User)
+            .where(User.id == user_id, User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+        )
+        await session.commit()
+
+
+def stats() -> dict:
+    return {
+        "workers": PASSWORD_WORKERS,
+        "queue_limit": PASSWORD_QUEUE_LIMIT,
+        "in_flight": _in_flight,
+        "rejected": rejected,
+        "restarts": restarts,
+    }
@@ -0,0 +1,232 @@
+"""
+Перенос проектов между окружениями: выгрузка и загрузка потоком NDJSON
+(одна строка — один проект со всеми вложенными сущностями).
+
+    curl -H "Authorization: Bearer $TOKEN" http://localhost:8000/api/projects/export > projects.ndjson
+    curl -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/x-ndjson" \\
+         --data-binary @projects.ndjson http://localhost:8000/api/projects/import
+
+Файлы изображений не переносятся — пути остаются как есть, каталог uploads/ копируется отдельно.
+"""
+import os
+from datetime import datetime
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
+
+from .database import SessionLocal
+from .dependencies import role_required
+from .models import Project, ProjectAboutCompany, ProjectStage, ProjectResult, ProjectResultImage, ProjectProgress
+from .responses import ORJSONResponse, orjson
+from .search import refresh_search_index
+
+EXPORT_BATCH_SIZE = int(os.getenv("PROJECT_EXPORT_BATCH_SIZE", "100"))
+IMPORT_BATCH_SIZE = int(os.getenv("PROJECT_IMPORT_BATCH_SIZE", "100"))
+# Одна строка NDJSON — один проект; защита от «строки» без переводов строк на гигабайты
+IMPORT_MAX_LINE_BYTES = int(os.getenv("PROJECT_IMPORT_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    import json
+    return json.dumps(value, ensure_ascii=False, default=str).encode()
+
+
+def loads(line: bytes):
+    if orjson is not None:
+        return orjson.loads(line)
+    import json
+    return json.loads(line)
+
+
+def export_project(project: Project) -> dict:
+    return {
+        "id": project.id,
+        "title": project.title,
+        "url": project.url,
+        "preview_img": project.preview_img,
+        "main_img": project.main_img,
+        "notebook_img": project.notebook_img,
+        "target": project.target,
+        "task": project.task,
+        "created_at": project.created_at.isoformat() if project.created_at else None,
+        "about_company": {
+            "title": project.about_company.title,
+            "description": project.about_company.description,
+        } if project.about_company else None,
+        "stages": [{"title": s.title, "description": s.description, "img": s.img} for s in project.stages],
+        "result": {
+            "description": project.result.description,
+            "images": [{"type": img.type, "img": img.img} for img in project.result.images],
+        } if project.result else None,
+        "progress": [{"digit": pr.digit, "text": pr.text} for pr in project.progresses],
+    }
+
+
+async def iter_export_lines():
+    # Своя сессия: поток читается уже после выхода из зависимостей запроса
+    async with SessionLocal() as session:
+        stmt = select(Project).order_by(Project.id).options(
+            selectinload(Project.about_company),
+            selectinload(Project.stages),
+            selectinload(Project.result).selectinload(ProjectResult.images),
+            selectinload(Project.progresses),
+        ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        # Серверный курсор: в памяти только текущая пачка, связи догружаются одним IN-запросом на пачку.
+        # identity map сессии держит объекты по слабым ссылкам, прочитанные пачки освобождаются сами
+        result = await session.stream_scalars(stmt)
+        async for batch in result.partitions():
+            yield b"".join(dumps(export_project(project)) + b"\n" for project in batch)
+
+
+@router.get("/projects/export")
+async def export_projects(user=Depends(role_required("admin"))):
+    return StreamingResponse(
+        iter_export_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="projects.ndjson"'},
+    )
+
+
+async def iter_ndjson(request: Request):
+    """Строки NDJSON из тела запроса по мере поступления: (номер строки, dict)"""
+    buffer = b""
+    line_no = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + len(lines) + 1} is too long")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, parse_line(line_no, line)
+    if buffer.strip():
+        yield line_no + 1, parse_line(line_no + 1, buffer)
+
+
+def parse_line(line_no: int, line: bytes) -> dict:
+    try:
+        data = loads(line)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Line {line_no}: invalid JSON: {e}")
+    if not isinstance(data, dict) or not data.get("title"):
+        raise HTTPException(status_code=400, detail=f"Line {line_no}: project object with title is required")
+    for key in ("about_company", "result"):
+        if data.get(key) is not None and not isinstance(data[key], dict):
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: {key} must be an object")
+    nested = [data.get("stages"), data.get("progress"), (data.get("result") or {}).get("images")]
+    for items in nested:
+        if items is not None and not (isinstance(items, list) and all(isinstance(i, dict) for i in items)):
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: stages, progress and result.images must be lists of objects")
+    return data
+
+
+def parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def insert_batch(batch: List[dict]) -> int:
+    """Одна транзакция на пачку: проекты — INSERT ... RETURNING, дочерние строки — executemany.
+    sort_by_parameter_order гарантирует порядок id; на PostgreSQL это один запрос на пачку,
+    SQLite такого не умеет, и SQLAlchemy вставляет проекты по одному"""
+    project_rows = []
+    for data in batch:
+        row = {key: data.get(key) for key in ("title", "url", "preview_img", "main_img", "notebook_img", "target", "task")}
+        created_at = parse_datetime(data.get("created_at"))
+        if created_at is not None:
+            row["created_at"] = created_at
+        project_rows.append(row)
+
+    async with SessionLocal() as session:
+        async with session.begin():
+            # У строк может не быть created_at — вставляем группами с одинаковым набором колонок
+            project_ids = [None] * len(batch)
+            for keys in {tuple(row) for row in project_rows}:
+                indexes = [i for i, row in enumerate(project_rows) if tuple(row) == keys]
+                ids = (await session.execute(
+                    insert(Project).returning(Project.id, sort_by_parameter_order=True),
+                    [project_rows[i] for i in indexes],
+                )).scalars().all()
+                for i, project_id in zip(indexes, ids):
+                    project_ids[i] = project_id
+
+            about_rows, stage_rows, progress_rows, result_rows, result_images = [], [], [], [], []
+            for project_id, data in zip(project_ids, batch):
+                about = data.get("about_company")
+                if about:
+                    about_rows.append({"project_id": project_id, "title": about.get("title"), "description": about.get("description")})
+                for s in data.get("stages") or []:
+                    stage_rows.append({"project_id": project_id, "title": s.get("title"), "description": s.get("description"), "img": s.get("img")})
+                for pr in data.get("progress") or []:
+                    progress_rows.append({"project_id": project_id, "digit": pr.get("digit"), "text": pr.get("text")})
+                result = data.get("result")
+                if result:
+                    result_rows.append({"project_id": project_id, "description": result.get("description")})
+                    result_images.append(result.get("images") or [])
+
+            if about_rows:
+                await session.execute(insert(ProjectAboutCompany), about_rows)
+            if stage_rows:
+                await session.execute(insert(ProjectStage), stage_rows)
+            if progress_rows:
+                await session.execute(insert(ProjectProgress), progress_rows)
+            if result_rows:
+                result_ids = (await session.execute(
+                    insert(ProjectResult).returning(ProjectResult.id, sort_by_parameter_order=True),
+                    result_rows,
+                )).scalars().all()
+                image_rows = [
+                    {"result_id": result_id, "type": img.get("type"), "img": img.get("img")}
+                    for result_id, images in zip(result_ids, result_images)
+                    for img in images
+                ]
+                if image_rows:
+                    await session.execute(insert(ProjectResultImage), image_rows)
+            await refresh_search_index(session, project_ids)
+    return len(batch)
+
+
+@router.post("/projects/import")
+async def import_projects(request: Request, user=Depends(role_required("admin"))):
+    """Загрузка NDJSON из /projects/export. Каждая пачка — отдельная транзакция:
+    при ошибке уже загруженные пачки остаются, в ответе — номер строки и сколько проектов загружено"""
+    imported = 0
+    batches = 0
+    batch = []
+    batch_start = 1
+
+    async def flush():
+        nonlocal imported, batches, batch
+        try:
+            imported += await insert_batch(batch)
+        except DBAPIError as e:
+            raise HTTPException(status_code=400, detail=f"Lines {batch_start}-{line_no}: {e.orig}")
+        batches += 1
+        batch = []
+
+    line_no = 0
+    try:
+        async for line_no, data in iter_ndjson(request):
+            if not batch:
+                batch_start = line_no
+            batch.append(data)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+        if batch:
+            await flush()
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{e.detail} (imported: {imported})")
+    return {"imported": imported, "batches": batches}
@@ -1,38 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import select
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, inspect, and_, or_, func
 from typing import List, Optional
-import shutil, os, json
+from datetime import datetime, timezone
+import asyncio, json, base64
 
-from .database import get_session
-from .dependencies import get_current_user, role_required
+from .database import get_session, SessionLocal
+from .cache import project_cache, project_key, PROJECT_CACHE_SIZE, PROJECT_CACHE_WARM
+from .uploads import store_upload, UploadBudget
+from .images import get_variants, load_variants, save_variants, schedule_variants
+from .search import refresh_search_index
+from .http_cache import make_etag, is_not_modified, validator_headers, not_modified_response
+from .responses import ORJSONResponse
+from .dependencies import role_required
 
 from .models import Project, ProjectAboutCompany, ProjectStage, ProjectResult, ProjectResultImage, ProjectProgress
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
-STAGES_UPLOADS_DIR = os.path.join(UPLOADS_DIR, "stages")
-RESULTS_UPLOADS_DIR = os.path.join(UPLOADS_DIR, "results")
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-os.makedirs(STAGES_UPLOADS_DIR, exist_ok=True)
-os.makedirs(RESULTS_UPLOADS_DIR, exist_ok=True)
-
-def save_file(file: Optional[UploadFile], *, directory: Optional[str] = None) -> Optional[str]:
-    if file is None:
-        return None
-    if not hasattr(file, 'filename') or not file.filename or file.filename.strip() == '':
-        return None
-    target_dir = directory if directory else UPLOADS_DIR
-    os.makedirs(target_dir, exist_ok=True)
-    file_loc = os.path.join(target_dir, file.filename)
-    with open(file_loc, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    if directory and directory.startswith(UPLOADS_DIR):
-        rel_path = os.path.relpath(file_loc, UPLOADS_DIR)
-        return rel_path.replace("\\", "/")
-    return file.filename
+async def save_file(file: Optional[UploadFile], *, budget: Optional[UploadBudget] = None) -> Optional[str]:
+    return await store_upload(file, budget)
 
 def parse_json_field(field: Optional[str]):
     if not field:
@@ -47,16 +35,149 @@ def parse_json_field(field: Optional[str]):
             raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
     return field
 
-def fetch_full_project(session: Session, project_id: int) -> Optional[Project]:
+async def fetch_full_project(session: AsyncSession, project_id: int) -> Optional[Project]:
     stmt = select(Project).where(Project.id == project_id).options(
         selectinload(Project.about_company),
         selectinload(Project.stages),
         selectinload(Project.result).selectinload(ProjectResult.images),
         selectinload(Project.progresses)
     )
-    result = session.execute(stmt)
+    result = await session.execute(stmt)
     return result.scalars().first()
 
+async def fetch_project_list(session: AsyncSession):
+    """Проекция для сетки портфолио: только нужные колонки одним JOIN-запросом"""
+    stmt = (
+        select(Project.id, Project.title, Project.preview_img, Project.variants_version, ProjectResult.description)
+        .outerjoin(ProjectResult, ProjectResult.project_id == Project.id)
+        .order_by(Project.id)
+    )
+    return (await session.execute(stmt)).all()
+
+def serialize_project_list_row(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "preview_img": row.preview_img,
+        "preview_img_variants": get_variants(row.preview_img),
+        "result": {
+            "description": row.description,
+        },
+    }
+
+# Поля, которые можно запросить через ?fields= в постраничном режиме списка
+PROJECT_LIST_FIELDS = {
+    "id": Project.id,
+    "title": Project.title,
+    "url": Project.url,
+    "preview_img": Project.preview_img,
+    "main_img": Project.main_img,
+    "notebook_img": Project.notebook_img,
+    "target": Project.target,
+    "task": Project.task,
+    "created_at": Project.created_at,
+    "result": ProjectResult.description,
+}
+DEFAULT_PROJECT_LIST_FIELDS = ["id", "title", "preview_img", "result"]
+MAX_PROJECT_PAGE_SIZE = 100
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return DEFAULT_PROJECT_LIST_FIELDS
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in PROJECT_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names or DEFAULT_PROJECT_LIST_FIELDS
+
+def encode_cursor(created_at: Optional[datetime], project_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, project_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, project_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(project_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def project_page_query(stmt, limit: Optional[int], cursor: Optional[str] = None):
+    """Условие и порядок keyset-страницы по (created_at, id). limit=None — весь список"""
+    if cursor:
+        created_at, project_id = decode_cursor(cursor)
+        if created_at is None:
+            stmt = stmt.where(and_(Project.created_at.is_(None), Project.id > project_id))
+        else:
+            # Сравниваем с created_at самой строки-курсора прямо в БД, чтобы не зависеть
+            # от формата хранения времени; значение из курсора — запасной вариант для удалённой строки
+            anchor = func.coalesce(
+                select(Project.created_at).where(Project.id == project_id).scalar_subquery(),
+                created_at,
+            )
+            stmt = stmt.where(or_(
+                Project.created_at > anchor,
+                and_(Project.created_at == anchor, Project.id > project_id),
+                Project.created_at.is_(None),
+            ))
+    stmt = stmt.order_by(Project.created_at.asc().nulls_last(), Project.id.asc())
+    # Лишняя строка показывает, есть ли следующая страница
+    return stmt if limit is None else stmt.limit(limit + 1)
+
+async def fetch_project_page(session: AsyncSession, fields: List[str], limit: int, cursor: Optional[str] = None):
+    """Keyset-пагинация по (created_at, id): страница без OFFSET, стоимость не зависит от номера страницы"""
+    columns = [PROJECT_LIST_FIELDS[f].label(f) for f in fields]
+    # created_at и id нужны для курсора, даже если клиент их не запросил
+    columns += [Project.created_at.label("_cursor_created_at"), Project.id.label("_cursor_id"),
+                Project.variants_version.label("_variants_version")]
+    stmt = select(*columns)
+    if "result" in fields:
+        stmt = stmt.outerjoin(ProjectResult, ProjectResult.project_id == Project.id)
+    rows = (await session.execute(project_page_query(stmt, limit, cursor))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last._cursor_created_at, last._cursor_id)
+
+    if "preview_img" in fields:
+        await load_variants(session, [(row.preview_img, row._variants_version) for row in rows])
+    items = []
+    for row in rows:
+        item = {}
+        for f in fields:
+            value = getattr(row, f)
+            if f == "result":
+                value = {"description": value}
+            elif f == "created_at" and value is not None:
+                value = value.isoformat()
+            item[f] = value
+            if f == "preview_img":
+                item["preview_img_variants"] = get_variants(value)
+        items.append(item)
+    return {"items": items, "next_cursor": next_cursor}
+
+async def fetch_project_validators(session: AsyncSession, project_id: int):
+    """ETag и Last-Modified проекта одним запросом по первичному ключу, без загрузки связей.
+    updated_at обновляется при любом изменении проекта, включая дочерние строки (см. update_project)"""
+    row = (await session.execute(
+        select(Project.updated_at, Project.variants_version).where(Project.id == project_id)
+    )).first()
+    if row is None:
+        return None
+    updated_at, variants_version = row
+    return make_etag("project", project_id, updated_at, variants_version), updated_at
+
+async def fetch_project_list_validators(session: AsyncSession, limit: Optional[int], cursor: Optional[str], *params) -> str:
+    """ETag списка по тем же строкам, что попадут в ответ (та же keyset-выборка, без остальной таблицы):
+    появление, удаление или изменение любой из них меняет ETag. Last-Modified у списка нет —
+    по максимальному updated_at не заметить удаление строки"""
+    rows = (await session.execute(
+        project_page_query(select(Project.id, Project.updated_at, Project.variants_version), limit, cursor)
+    )).all()
+    return make_etag("projects", *(value for row in rows for value in row), *params)
+
 def serialize_project(project: Project):
     return {
         "id": project.id,
@@ -65,6 +186,11 @@ def serialize_project(project: Project):
         "preview_img": project.preview_img,
         "main_img": project.main_img,
         "notebook_img": project.notebook_img,
+        "variants": {
+            "preview_img": get_variants(project.preview_img),
+            "main_img": get_variants(project.main_img),
+            "notebook_img": get_variants(project.notebook_img),
+        },
         "target": project.target,
         "task": project.task,
         "about_company": {
@@ -72,13 +198,13 @@ def serialize_project(project: Project):
             "description": project.about_company.description
         } if project.about_company else None,
         "stages": [
-            {"title": s.title, "description": s.description, "img": s.img}
+            {"title": s.title, "description": s.description, "img": s.img, "img_variants": get_variants(s.img)}
             for s in project.stages
         ],
         "result": {
             "description": project.result.description,
             "images": [
-                {"type": img.type, "img": img.img}
+                {"type": img.type, "img": img.img, "img_variants": get_variants(img.img)}
                 for img in (project.result.images if project.result else [])
             ]
         } if project.result else None,
@@ -88,27 +214,70 @@ def serialize_project(project: Project):
         ]
     }
 
+def project_image_paths(project: Project) -> List[str]:
+    # PATCH загружает не все связи — берём картинки только из загруженных
+    unloaded = inspect(project).unloaded
+    paths = [project.preview_img, project.main_img, project.notebook_img]
+    if "stages" not in unloaded:
+        paths += [s.img for s in project.stages]
+    if "result" not in unloaded and project.result and "images" not in inspect(project.result).unloaded:
+        paths += [img.img for img in project.result.images]
+    return [p for p in paths if p]
+
+def project_images(project: Project) -> list:
+    """Пары (путь, версия вариантов) для load_variants"""
+    return [(path, project.variants_version) for path in project_image_paths(project)]
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+_background_tasks = set()
+
+async def mark_variants_ready(project_id: int, results: dict):
+    """Варианты готовы: записываем их в БД, сдвигаем версию вариантов (она входит в ETag)
+    и сбрасываем закэшированный ответ. updated_at не трогаем — содержимое проекта не менялось"""
+    await save_variants(results)
+    async with SessionLocal() as session:
+        # updated_at передаём явно, иначе сработает onupdate
+        await session.execute(
+            update(Project).where(Project.id == project_id)
+            .values(variants_version=Project.variants_version + 1, updated_at=Project.updated_at)
+        )
+        await session.commit()
+    await project_cache.invalidate(project_key(project_id))
+
+async def schedule_project_variants(session: AsyncSession, project: Project):
+    project_id = project.id
+    paths = project_image_paths(project)
+    await load_variants(session, project_images(project))
+
+    def on_done(results):
+        task = asyncio.get_running_loop().create_task(mark_variants_ready(project_id, results))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    schedule_variants(paths, on_done=on_done)
+
 @router.post("/projects")
-def create_project(
+async def create_project(
     title: str = Form(...), url: str = Form(...), target: str = Form(""), task: str = Form(""),
     about_company: str = Form("{}"), stages: str = Form("[]"), result: str = Form("{}"), progress: str = Form("[]"),
     preview_img: Optional[UploadFile] = File(None), main_img: Optional[UploadFile] = File(None), notebook_img: Optional[UploadFile] = File(None),
     stage_imgs: Optional[List[UploadFile]] = File(None), result_imgs: Optional[List[UploadFile]] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     user=Depends(role_required("admin")),
 ):
-    preview_img_name = save_file(preview_img)
-    main_img_name = save_file(main_img)
-    notebook_img_name = save_file(notebook_img)
+    budget = UploadBudget()
+    preview_img_name = await save_file(preview_img, budget=budget)
+    main_img_name = await save_file(main_img, budget=budget)
+    notebook_img_name = await save_file(notebook_img, budget=budget)
 
     stage_img_names = []
     if stage_imgs:
         for img in stage_imgs:
-            stage_img_names.append(save_file(img, directory=STAGES_UPLOADS_DIR))
+            stage_img_names.append(await save_file(img, budget=budget))
     result_img_names = []
     if result_imgs:
         for img in result_imgs:
-            result_img_names.append(save_file(img, directory=RESULTS_UPLOADS_DIR))
+            result_img_names.append(await save_file(img, budget=budget))
     if result_imgs and not result_img_names:
         raise HTTPException(status_code=400, detail="result_imgs загружены, но имена файлов не получены")
     
@@ -155,145 +324,297 @@ def create_project(
         target=target, task=task, about_company=about_obj, stages=stages_obj, result=result_obj, progresses=progress_obj
     )
     session.add(project)
-    session.commit()
-    project = fetch_full_project(session, project.id)
-    return serialize_project(project)
+    await session.flush()
+    await refresh_search_index(session, [project.id])
+    await session.commit()
+    await project_cache.invalidate(project_key(project.id))
+    project = await fetch_full_project(session, project.id)
+    await schedule_project_variants(session, project)
+    return ORJSONResponse(serialize_project(project))
 
 @router.get("/projects")
-def get_projects(
-    session: Session = Depends(get_session),
+async def get_projects(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PROJECT_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
 ):
-    result = session.execute(select(Project))
-    projects = result.scalars().all()
-    return [
-        {
-            "id": p.id,
-            "title": p.title,
-            "preview_img": p.preview_img,
-            "result": {
-                "description": p.result.description if p.result else None,
-            },
-        }
-        for p in projects
-    ]
+    # Без limit/cursor/fields сохраняем прежний ответ — полный список
+    paged = limit is not None or cursor or fields
+    page_limit = (limit or MAX_PROJECT_PAGE_SIZE) if paged else None
+    etag = await fetch_project_list_validators(session, page_limit, cursor, limit, fields)
+    if is_not_modified(request, etag, None):
+        return not_modified_response(etag, None)
+    headers = validator_headers(etag, None)
+
+    if paged:
+        data = await fetch_project_page(session, parse_fields(fields), page_limit, cursor)
+    else:
+        rows = await fetch_project_list(session)
+        await load_variants(session, [(row.preview_img, row.variants_version) for row in rows])
+        data = [serialize_project_list_row(row) for row in rows]
+    # Данные уже из примитивов — отдаём готовый ответ в обход jsonable_encoder
+    return ORJSONResponse(data, headers=headers)
 
 @router.get("/projects/{project_id}")
-def get_full_project(
+async def get_full_project(
     project_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    session: AsyncSession = Depends(get_session),
 ):
-    project = fetch_full_project(session, project_id)
-    if not project:
+    cached = await project_cache.get(project_key(project_id))
+    if cached is not None:
+        etag = cached["etag"]
+        last_modified = datetime.fromisoformat(cached["last_modified"]) if cached["last_modified"] else None
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        return ORJSONResponse(cached["data"], headers=validator_headers(etag, last_modified))
+
+    generation = await project_cache.generation()
+    validators = await fetch_project_validators(session, project_id)
+    if validators is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    etag, last_modified = validators
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+
+    data = await cache_full_project(session, project_id, etag, last_modified, generation)
+    if data is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return serialize_project(project)
+    return ORJSONResponse(data, headers=validator_headers(etag, last_modified))
+
+async def cache_full_project(session: AsyncSession, project_id: int, etag: str,
+                             last_modified: Optional[datetime], generation: int) -> Optional[dict]:
+    """Загружает и сериализует проект и кладёт его в кэш (если поколение кэша не сменилось)"""
+    project = await fetch_full_project(session, project_id)
+    if not project:
+        return None
+    await load_variants(session, project_images(project))
+    data = serialize_project(project)
+    await project_cache.set(
+        project_key(project_id),
+        {"data": data, "etag": etag, "last_modified": last_modified.isoformat() if last_modified else None},
+        generation=generation,
+    )
+    return data
+
+async def warm_project_cache(limit: int = PROJECT_CACHE_WARM) -> int:
+    """Прогрев при старте: проекты первой страницы списка открывают чаще всего"""
+    if limit <= 0 or PROJECT_CACHE_SIZE <= 0:
+        return 0
+    warmed = 0
+    async with SessionLocal() as session:
+        ids = (await session.execute(
+            select(Project.id).order_by(Project.created_at.asc().nulls_last(), Project.id.asc()).limit(limit)
+        )).scalars().all()
+        for project_id in ids:
+            generation = await project_cache.generation()
+            validators = await fetch_project_validators(session, project_id)
+            if validators is not None and await cache_full_project(session, project_id, *validators, generation) is not None:
+                warmed += 1
+    return warmed
+
+async def save_files(files: Optional[List[UploadFile]], budget: UploadBudget) -> List[str]:
+    names = []
+    for file in files or []:
+        names.append(await save_file(file, budget=budget))
+    return names
+
+def build_stage_values(stages_data: list, stage_img_names: List[str]) -> List[dict]:
+    values = []
+    for idx, s in enumerate(stages_data):
+        img_name = s.get("img")
+        if not img_name and idx < len(stage_img_names):
+            img_name = stage_img_names[idx]
+        values.append({"title": s["title"], "description": s["description"], "img": img_name})
+    return values
+
+def build_result_image_values(images_meta: list, result_img_names: List[str]) -> List[dict]:
+    # Если метаданные картинок не пришли, берём только загруженные файлы
+    if not images_meta:
+        return [
+            {"type": "tablet" if idx == 0 else "smartphone", "img": img_name}
+            for idx, img_name in enumerate(result_img_names)
+        ]
+    values = []
+    for idx, img in enumerate(images_meta):
+        uploaded_img = result_img_names[idx] if idx < len(result_img_names) else None
+        values.append({"type": "tablet" if idx == 0 else "smartphone", "img": uploaded_img or img.get("img")})
+    return values
+
+def assign_changed(obj, values: dict):
+    """Присваивает только отличающиеся значения, чтобы не помечать строку изменённой зря"""
+    for key, value in values.items():
+        if getattr(obj, key) != value:
+            setattr(obj, key, value)
+
+def sync_children(collection, values: List[dict], model):
+    """Приводит коллекцию к списку values по позициям: UPDATE изменённых строк,
+    INSERT недостающих, DELETE лишних (delete-orphan). Первичные ключи сохраняются"""
+    existing = len(collection)
+    for row, row_values in zip(collection, values):
+        assign_changed(row, row_values)
+    if existing > len(values):
+        del collection[len(values):]
+    for row_values in values[existing:]:
+        collection.append(model(**row_values))
+
+def has_pending_changes(session: AsyncSession) -> bool:
+    return bool(session.new or session.deleted or any(session.is_modified(obj) for obj in session.dirty))
+
+async def finish_project_update(session: AsyncSession, project: Project) -> dict:
+    if not has_pending_changes(session):
+        # Ничего не изменилось — ни одного запроса на запись, ETag остаётся прежним.
+        # Ответ тот же, что и при изменении: клиенту не нужно различать эти случаи
+        return {"detail": "Updated"}
+    # Явно двигаем updated_at: от него считается ETag, а изменения дочерних строк
+    # сами по себе не вызывают UPDATE таблицы project
+    project.updated_at = datetime.now(timezone.utc)
+    await session.flush()
+    await refresh_search_index(session, [project.id])
+    await session.commit()
+    await project_cache.invalidate(project_key(project.id))
+    await schedule_project_variants(session, project)
+    return {"detail": "Updated"}
 
 @router.put("/projects/{project_id}")
-def update_project(
+async def update_project(
     project_id: int,
     title: str = Form(...), url: str = Form(...), target: str = Form(""), task: str = Form(""),
     about_company: str = Form("{}"), stages: str = Form("[]"), result: str = Form("{}"), progress: str = Form("[]"),
     preview_img: Optional[UploadFile] = File(None), main_img: Optional[UploadFile] = File(None), notebook_img: Optional[UploadFile] = File(None),
     stage_imgs: Optional[List[UploadFile]] = File(None), result_imgs: Optional[List[UploadFile]] = File(None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     user=Depends(role_required("admin")),
 ):
-    project = fetch_full_project(session, project_id)
+    project = await fetch_full_project(session, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Not found")
 
-    project.title = title
-    project.url = url
-    project.target = target
-    project.task = task
+    about = parse_json_field(about_company)
+    if not about:
+        raise HTTPException(status_code=400, detail="about_company is required")
+    res = parse_json_field(result)
+    if not res:
+        raise HTTPException(status_code=400, detail="result is required")
+
+    budget = UploadBudget()
+    assign_changed(project, {"title": title, "url": url, "target": target, "task": task})
     if preview_img:
-        project.preview_img = save_file(preview_img)
+        assign_changed(project, {"preview_img": await save_file(preview_img, budget=budget)})
     if main_img:
-        project.main_img = save_file(main_img)
+        assign_changed(project, {"main_img": await save_file(main_img, budget=budget)})
     if notebook_img:
-        project.notebook_img = save_file(notebook_img)
+        assign_changed(project, {"notebook_img": await save_file(notebook_img, budget=budget)})
 
-    about = parse_json_field(about_company)
-    if not about:
-        raise HTTPException(status_code=400, detail="about_company is required")
     if project.about_company:
-        project.about_company.title = about["title"]
-        project.about_company.description = about["description"]
+        assign_changed(project.about_company, {"title": about["title"], "description": about["description"]})
     else:
-        project.about_company = ProjectAboutCompany(
-            title=about["title"],
-            description=about["description"]
-        )
+        project.about_company = ProjectAboutCompany(title=about["title"], description=about["description"])
 
-    del project.stages[:]
-    parsed_stages = parse_json_field(stages) or []
-    stage_img_names = []
-    if stage_imgs:
-        for img in stage_imgs:
-            stage_img_names.append(save_file(img, directory=STAGES_UPLOADS_DIR))
-    for idx, s in enumerate(parsed_stages):
-        img_name = s.get("img")
-        if not img_name and idx < len(stage_img_names):
-            img_name = stage_img_names[idx]
-        project.stages.append(ProjectStage(title=s["title"], description=s["description"], img=img_name))
+    stage_img_names = await save_files(stage_imgs, budget)
+    sync_children(project.stages, build_stage_values(parse_json_field(stages) or [], stage_img_names), ProjectStage)
 
-    res = parse_json_field(result)
-    if not res:
-        raise HTTPException(status_code=400, detail="result is required")
-    result_img_names = []
-    if result_imgs:
-        for img in result_imgs:
-            result_img_names.append(save_file(img, directory=RESULTS_UPLOADS_DIR))
-    images_meta = res.get("images") or []
+    result_img_names = await save_files(result_imgs, budget)
+    image_values = build_result_image_values(res.get("images") or [], result_img_names)
     if project.result:
-        del project.result.images[:]
-        if images_meta:
-            for idx, img in enumerate(images_meta):
-                uploaded_img = result_img_names[idx] if idx < len(result_img_names) else None
-                img_name = uploaded_img or img.get("img")
-                img_type = "tablet" if idx == 0 else "smartphone"
-                project.result.images.append(ProjectResultImage(type=img_type, img=img_name))
-        else:
-            for idx, img_name in enumerate(result_img_names):
-                img_type = "tablet" if idx == 0 else "smartphone"
-                project.result.images.append(ProjectResultImage(type=img_type, img=img_name))
-        project.result.description = res["description"]
+        assign_changed(project.result, {"description": res["description"]})
+        sync_children(project.result.images, image_values, ProjectResultImage)
     else:
-        if images_meta:
-            images_list = []
-            for idx, img in enumerate(images_meta):
-                uploaded_img = result_img_names[idx] if idx < len(result_img_names) else None
-                img_name = uploaded_img or img.get("img")
-                img_type = "tablet" if idx == 0 else "smartphone"
-                images_list.append(ProjectResultImage(type=img_type, img=img_name))
-        else:
-            images_list = [
-                ProjectResultImage(
-                    type=("tablet" if idx == 0 else "smartphone"),
-                    img=img_name,
-                )
-                for idx, img_name in enumerate(result_img_names)
-            ]
-
         project.result = ProjectResult(
             description=res["description"],
-            images=images_list,
+            images=[ProjectResultImage(**values) for values in image_values],
         )
 
-    del project.progresses[:]
-    for pr in parse_json_field(progress) or []:
-        project.progresses.append(ProjectProgress(digit=pr["digit"], text=pr["text"]))
-    session.commit()
-    return {"detail": "Updated"}
+    progress_values = [{"digit": pr["digit"], "text": pr["text"]} for pr in parse_json_field(progress) or []]
+    sync_children(project.progresses, progress_values, ProjectProgress)
+    return await finish_project_update(session, project)
+
+@router.patch("/projects/{project_id}")
+async def patch_project(
+    project_id: int,
+    title: Optional[str] = Form(None), url: Optional[str] = Form(None),
+    target: Optional[str] = Form(None), task: Optional[str] = Form(None),
+    about_company: Optional[str] = Form(None), stages: Optional[str] = Form(None),
+    result: Optional[str] = Form(None), progress: Optional[str] = Form(None),
+    preview_img: Optional[UploadFile] = File(None), main_img: Optional[UploadFile] = File(None), notebook_img: Optional[UploadFile] = File(None),
+    stage_imgs: Optional[List[UploadFile]] = File(None), result_imgs: Optional[List[UploadFile]] = File(None),
+    session: AsyncSession = Depends(get_session),
+    user=Depends(role_required("admin")),
+):
+    """Частичное обновление: не переданные поля и разделы не трогаются и даже не читаются"""
+    if stage_imgs and stages is None:
+        raise HTTPException(status_code=400, detail="stage_imgs require stages")
+    if result_imgs and result is None:
+        raise HTTPException(status_code=400, detail="result_imgs require result")
+
+    # Загружаем только те связи, которые будем менять
+    options = []
+    if about_company is not None:
+        options.append(selectinload(Project.about_company))
+    if stages is not None:
+        options.append(selectinload(Project.stages))
+    if result is not None:
+        options.append(selectinload(Project.result).selectinload(ProjectResult.images))
+    if progress is not None:
+        options.append(selectinload(Project.progresses))
+    project = (await session.execute(select(Project).where(Project.id == project_id).options(*options))).scalar_one_or_none()
+    if not project:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    budget = UploadBudget()
+    scalars = {"title": title, "url": url, "target": target, "task": task}
+    assign_changed(project, {key: value for key, value in scalars.items() if value is not None})
+    if preview_img:
+        assign_changed(project, {"preview_img": await save_file(preview_img, budget=budget)})
+    if main_img:
+        assign_changed(project, {"main_img": await save_file(main_img, budget=budget)})
+    if notebook_img:
+        assign_changed(project, {"notebook_img": await save_file(notebook_img, budget=budget)})
+
+    if about_company is not None:
+        about = parse_json_field(about_company) or {}
+        about_values = {key: about[key] for key in ("title", "description") if key in about}
+        if project.about_company:
+            assign_changed(project.about_company, about_values)
+        elif about_values:
+            project.about_company = ProjectAboutCompany(**about_values)
+
+    if stages is not None:
+        stage_img_names = await save_files(stage_imgs, budget)
+        sync_children(project.stages, build_stage_values(parse_json_field(stages) or [], stage_img_names), ProjectStage)
+
+    if result is not None:
+        res = parse_json_field(result) or {}
+        result_img_names = await save_files(result_imgs, budget)
+        if not project.result:
+            project.result = ProjectResult(description=res.get("description"))
+        elif "description" in res:
+            assign_changed(project.result, {"description": res["description"]})
+        # Картинки синхронизируем, только если их прислали
+        if "images" in res or result_img_names:
+            image_values = build_result_image_values(res.get("images") or [], result_img_names)
+            sync_children(project.result.images, image_values, ProjectResultImage)
+
+    if progress is not None:
+        progress_values = [{"digit": pr["digit"], "text": pr["text"]} for pr in parse_json_field(progress) or []]
+        sync_children(project.progresses, progress_values, ProjectProgress)
+    return await finish_project_update(session, project)
 
 @router.delete("/projects/{project_id}")
-def delete_project(
+async def delete_project(
     project_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     user=Depends(role_required("admin")),
 ):
-    project = fetch_full_project(session, project_id)
+    project = await fetch_full_project(session, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Not found")
-    session.delete(project)
-    session.commit()
+    await session.delete(project)
+    await session.flush()
+    # В PostgreSQL запись индекса удалит каскад, FTS5 внешних ключей не знает
+    await refresh_search_index(session, [project_id])
+    await session.commit()
+    await project_cache.invalidate(project_key(project_id))
     return {"detail": "Deleted"}
\ No newline at end of file
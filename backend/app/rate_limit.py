@@ -0,0 +1,224 @@
+"""
+Ограничение частоты запросов к эндпоинтам авторизации (token bucket).
+
+У каждого ключа (IP, IP + email, email, пользователь) есть «ведро» на capacity жетонов, которое
+пополняется равномерно: capacity жетонов за period секунд. Запрос забирает жетон;
+если жетонов нет — 429 с Retry-After. Проверка выполняется до запросов к БД и bcrypt,
+поэтому перебор паролей не превращается в нагрузку на CPU всего сервиса. Лимит по IP + email
+после успешного входа возвращает жетон — расходуют его только неудачные попытки. Общий лимит
+по email списывается уже после проверки пароля и только за неверный: верный пароль пускает всегда.
+
+Хранилище (RATE_LIMIT_BACKEND):
+  - memory — в памяти процесса, у каждого воркера uvicorn свои вёдра;
+  - sqlite — общий файл на хосте (RATE_LIMIT_URL), вёдра общие для всех воркеров.
+
+IP берётся из request.client: за nginx запускайте uvicorn с --proxy-headers
+и --forwarded-allow-ips, иначе все запросы придут с адреса прокси.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from .database import env_bool
+
+RATE_LIMIT_ENABLED = env_bool("RATE_LIMIT_ENABLED", True)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | sqlite
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "")  # путь к файлу SQLite
+# Сколько вёдер держать в памяти; самые давние вытесняются (и начинают с полного ведра)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Формат лимита: "<жетонов>/<секунд>", 0 — без ограничения
+RATE_LIMIT_LOGIN_IP = os.getenv("RATE_LIMIT_LOGIN_IP", "20/60")
+# Неудачные входы в один аккаунт: строгий лимит — с одного адреса, мягкий — со всех вместе.
+# Мягкий не проверяется до пароля: иначе аноним с нескольких адресов держал бы ведро пустым
+# и не пускал владельца. Когда он исчерпан, неверный пароль получает 429 вместо 401 (клиент
+# отступает на Retry-After, отказы видны в /health/rate-limit); темп перебора ограничивают лимиты по IP
+RATE_LIMIT_LOGIN_IP_EMAIL = os.getenv("RATE_LIMIT_LOGIN_IP_EMAIL", "5/300")
+RATE_LIMIT_LOGIN_EMAIL = os.getenv("RATE_LIMIT_LOGIN_EMAIL", "100/3600")
+RATE_LIMIT_REFRESH_IP = os.getenv("RATE_LIMIT_REFRESH_IP", "60/60")
+RATE_LIMIT_REFRESH_USER = os.getenv("RATE_LIMIT_REFRESH_USER", "30/60")
+
+
+class MemoryBuckets:
+    """Вёдра в памяти процесса; число ключей ограничено, чтобы поток случайных IP не съел память"""
+
+    blocking = False  # take() не ждёт ввода-вывода, вызывается прямо в обработчике
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (жетоны, время обновления)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        """Забирает жетон. Возвращает 0, если он был, иначе — сколько секунд ждать следующего"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens, wait = _refill_and_take(tokens, updated_at, now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key: str, capacity: float):
+        """Возвращает жетон в ведро"""
+        with self._lock:
+            item = self._buckets.get(key)
+            if item is not None:
+                self._buckets[key] = (min(capacity, item[0] + 1), item[1])
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "maxsize": self.maxsize}
+
+
+class SQLiteBuckets:
+    """Вёдра в файле SQLite, общие для всех воркеров на хосте. Чтение и запись ведра —
+    в одной транзакции BEGIN IMMEDIATE, поэтому параллельные воркеры не получат один жетон дважды"""
+
+    # take() может ждать блокировку файла до timeout — вызывается в пуле потоков, не в цикле событий
+    blocking = True
+
+    # Полные вёдра не нужны: раз в CLEANUP_EVERY обращений удаляем давно не тронутые
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._calls = 0
+
+    def _conn(self):
+        # Как SQLiteCache: файл открывается при первом обращении, после fork — заново
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_bucket ("
+                    "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_bucket_full_at ON rate_bucket (full_at)")
+                self._schema_ready = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, wait = _refill_and_take(tokens, updated_at, now, capacity, rate)
+            full_at = now + (capacity - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_bucket (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at),
+            )
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute("DELETE FROM rate_bucket WHERE full_at <= ?", (now,))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return wait
+
+    def refund(self, key: str, capacity: float):
+        # Одиночный UPDATE атомарен, отдельная транзакция не нужна
+        self._conn().execute("UPDATE rate_bucket SET tokens = MIN(?, tokens + 1) WHERE key = ?", (capacity, key))
+
+    def stats(self) -> dict:
+        keys = self._conn().execute("SELECT COUNT(*) FROM rate_bucket").fetchone()[0]
+        return {"backend": "sqlite", "keys": keys}
+
+
+def _refill_and_take(tokens, updated_at, now, capacity, rate):
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+def create_backend(backend: str = RATE_LIMIT_BACKEND, url: str = RATE_LIMIT_URL):
+    if backend == "memory":
+        return MemoryBuckets()
+    if backend == "sqlite":
+        path = url or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "ratelimit.sqlite3")
+        return SQLiteBuckets(path)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+buckets = create_backend()
+rejected = {}  # имя лимита -> сколько запросов получили 429 (в этом процессе)
+
+
+class RateLimit:
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        self.spec = spec
+        capacity, _, period = spec.partition("/")
+        self.capacity = float(capacity or 0)
+        self.rate = self.capacity / float(period or 1) if self.capacity > 0 else 0.0
+
+    async def hit(self, key: str):
+        """Забирает жетон для ключа или отвечает 429"""
+        if not RATE_LIMIT_ENABLED or self.capacity <= 0:
+            return
+        if buckets.blocking:
+            wait = await run_in_threadpool(buckets.take, f"{self.name}:{key}", self.capacity, self.rate)
+        else:
+            wait = buckets.take(f"{self.name}:{key}", self.capacity, self.rate)
+        if wait > 0:
+            rejected[self.name] = rejected.get(self.name, 0) + 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    async def refund(self, key: str):
+        """Возвращает жетон: так лимит считает только неудачные попытки"""
+        if not RATE_LIMIT_ENABLED or self.capacity <= 0:
+            return
+        if buckets.blocking:
+            await run_in_threadpool(buckets.refund, f"{self.name}:{key}", self.capacity)
+        else:
+            buckets.refund(f"{self.name}:{key}", self.capacity)
+
+
+login_ip_limit = RateLimit("login:ip", RATE_LIMIT_LOGIN_IP)
+login_ip_email_limit = RateLimit("login:ip-email", RATE_LIMIT_LOGIN_IP_EMAIL)
+login_email_limit = RateLimit("login:email", RATE_LIMIT_LOGIN_EMAIL)
+refresh_ip_limit = RateLimit("refresh:ip", RATE_LIMIT_REFRESH_IP)
+refresh_user_limit = RateLimit("refresh:user", RATE_LIMIT_REFRESH_USER)
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def email_key(email: str) -> str:
+    # В хранилище — дайджест, а не сам адрес
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()[:32]
+
+
+def stats() -> dict:
+    limits = (login_ip_limit, login_ip_email_limit, login_email_limit, refresh_ip_limit, refresh_user_limit)
+    return {
+        "enabled": RATE_LIMIT_ENABLED,
+        **buckets.stats(),
+        "limits": {limit.name: limit.spec for limit in limits},
+        "rejected": dict(rejected),
+    }
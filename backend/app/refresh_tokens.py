@@ -0,0 +1,172 @@
+"""
+Хранилище refresh-токенов: ротация, отзыв и обнаружение повторного использования.
+
+Каждый refresh-токен несёт jti и записан в таблицу refresh_tokens. /auth/refresh
+помечает предъявленный токен использованным и выдаёт новый из того же семейства
+(одно семейство — одна сессия входа). Если использованный токен предъявлен ещё раз —
+его украли или скопировали: отзывается всё семейство, и владелец, и злоумышленник
+должны войти заново.
+
+Источник истины — БД. В памяти воркера лежат отозванные jti и отметки «выйти везде»
+по пользователям: повторные попытки с уже отозванным токеном отсекаются за O(1)
+без запроса к БД. Отзыв, сделанный другим воркером, здесь не виден — его поймает
+проверка в БД при ротации.
+
+Просроченные записи удаляются раз в REFRESH_TOKEN_COMPACT_INTERVAL секунд (lifespan) или вручную:
+    python -m app.refresh_tokens --compact
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete
+
+from .cache import TTLCache
+from .database import SessionLocal
+from .models import RefreshToken, User
+from .utils import create_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS
+
+# Сколько отозванных jti помнить в памяти воркера (дальше — проверка только в БД)
+REFRESH_REVOKED_CACHE_SIZE = int(os.getenv("REFRESH_REVOKED_CACHE_SIZE", "10000"))
+# Как часто удалять просроченные записи из refresh_tokens, секунды (0 — только вручную)
+REFRESH_TOKEN_COMPACT_INTERVAL = float(os.getenv("REFRESH_TOKEN_COMPACT_INTERVAL", "3600"))
+
+REFRESH_TOKEN_LIFETIME = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
+# jti -> True; запись живёт до exp токена — после него токен отвергнет проверка подписи
+revoked_jtis = TTLCache(maxsize=REFRESH_REVOKED_CACHE_SIZE, ttl=REFRESH_TOKEN_LIFETIME.total_seconds())
+# user_id -> время «выйти везде»: токены, выпущенные раньше, недействительны
+revoked_before = TTLCache(maxsize=REFRESH_REVOKED_CACHE_SIZE, ttl=REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def is_revoked(payload: dict) -> bool:
+    """Быстрая проверка по памяти воркера, без БД"""
+    if revoked_jtis.get(payload.get("jti")):
+        return True
+    cutoff = revoked_before.get(payload.get("user_id"))
+    return cutoff is not None and payload.get("iat", 0) < cutoff
+
+
+def _remember_revoked(jtis, exp: float = None):
+    ttl = None if exp is None else max(0.0, exp - time.time())
+    for jti in jtis:
+        revoked_jtis.set(jti, True, ttl=ttl)
+
+
+def issue_refresh_token(session, claims: dict, family: str = None) -> str:
+    """Выпускает refresh-токен и записывает его в сессию; commit — за вызывающим"""
+    jti = secrets.token_hex(16)
+    now = _now()
+    session.add(RefreshToken(
+        jti=jti,
+        user_id=claims["user_id"],
+        family=family or jti,
+        created_at=now,
+        expires_at=now + REFRESH_TOKEN_LIFETIME,
+    ))
+    return create_refresh_token(
+        {**claims, "jti": jti, "iat": int(now.timestamp())},
+        expires_delta=REFRESH_TOKEN_LIFETIME,
+    )
+
+
+async def rotate_refresh_token(session, payload: dict):
+    """Помечает предъявленный токен использованным. Возвращает (семейство, пользователь) —
+    роли берутся из БД, а не из токена. При отзыве или повторном использовании — 401"""
+    jti = payload.get("jti")
+    if not jti:
+        # Токены, выпущенные до появления хранилища, не отозвать — требуем войти заново
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Refresh token revoked")
+
+    # Условный UPDATE атомарен: из двух параллельных запросов с одним токеном пройдёт один
+    claimed = await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.jti == jti, RefreshToken.used_at.is_(None), RefreshToken.revoked_at.is_(None))
+        .values(used_at=_now())
+    )
+    if claimed.rowcount != 1:
+        token = await session.get(RefreshToken, jti)
+        if token is not None and token.revoked_at is None:
+            # Токен уже обменяли на новый — кто-то использует копию
+            await revoke_family(session, token.family, payload.get("exp"))
+            await session.commit()
+        else:
+            await session.rollback()
+            _remember_revoked([jti], payload.get("exp"))
+        raise HTTPException(status_code=401, detail="Refresh token revoked")
+
+    row = (await session.execute(
+        select(RefreshToken.family, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.jti == jti)
+    )).first()
+    if row is None:
+        await session.rollback()
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return row.family, row.User
+
+
+async def revoke_family(session, family: str, exp: float = None):
+    """Отзывает все токены сессии входа"""
+    jtis = (await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_now())
+        .returning(RefreshToken.jti)
+    )).scalars().all()
+    _remember_revoked(jtis, exp)
+
+
+async def revoke_user_tokens(session, user_id: int):
+    """«Выйти везде»: отзывает все refresh-токены пользователя"""
+    await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    # iat — в целых секундах: токены, выпущенные в ту же секунду, отсечёт проверка в БД
+    revoked_before.set(user_id, int(time.time()))
+
+
+async def compact_refresh_tokens() -> int:
+    """Удаляет просроченные записи: такие токены отвергает уже проверка exp в JWT"""
+    async with SessionLocal() as session:
+        result = await session.execute(delete(RefreshToken).where(RefreshToken.expires_at < _now()))
+        await session.commit()
+    return result.rowcount
+
+
+async def compact_periodically(interval: float = REFRESH_TOKEN_COMPACT_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await compact_refresh_tokens()
+        except Exception as e:
+            print(f"Очистка refresh_tokens не удалась: {e}")
+            continue
+        if removed:
+            print(f"✓ Удалено просроченных refresh-токенов: {removed}")
+
+
+def stats() -> dict:
+    return {"revoked_jtis": revoked_jtis.stats(), "revoked_users": revoked_before.stats()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compact", action="store_true", help="Удалить просроченные записи")
+    args = parser.parse_args()
+    if args.compact:
+        print(f"Удалено просроченных refresh-токенов: {asyncio.run(compact_refresh_tokens())}")
+    else:
+        parser.print_help()
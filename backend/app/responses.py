@@ -0,0 +1,22 @@
+"""
+Быстрый JSON-ответ на orjson.
+
+Роутеры используют ORJSONResponse по умолчанию. Горячие эндпоинты возвращают его
+напрямую с уже готовыми dict — тогда FastAPI не прогоняет данные через jsonable_encoder.
+Без установленного orjson ответ сериализуется стандартным json.
+"""
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson указан в requirements.txt
+    orjson = None
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import time
+
+from sqlalchemy import select
+
+from .database import SessionLocal
+from .models import Role
+
+# Роли меняются редко: держим справочник id <-> имя в памяти процесса.
+# В своём воркере он сбрасывается эндпоинтами /admin/roles сразу, в остальных —
+# по истечении ROLE_REGISTRY_TTL
+ROLE_REGISTRY_TTL = float(os.getenv("ROLE_REGISTRY_TTL", "60"))
+
+
+class RoleRegistry:
+    def __init__(self, ttl: float = ROLE_REGISTRY_TTL):
+        self.ttl = ttl
+        self._by_id = {}
+        self._by_name = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def ensure_loaded(self):
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if self.is_fresh():
+                return
+            async with SessionLocal() as session:
+                rows = (await session.execute(select(Role.id, Role.name))).all()
+            self.load(rows)
+
+    def load(self, rows):
+        # Новые словари подменяются целиком, читатели всегда видят согласованное состояние
+        self._by_id = {role_id: name for role_id, name in rows}
+        self._by_name = {name: role_id for role_id, name in rows}
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def name(self, role_id: int):
+        return self._by_id.get(role_id)
+
+    def id_for(self, name: str):
+        return self._by_name.get(name)
+
+    def names(self, role_ids) -> list:
+        return [self._by_id[rid] for rid in role_ids if rid in self._by_id]
+
+
+role_registry = RoleRegistry()
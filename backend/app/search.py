@@ -0,0 +1,201 @@
+"""
+Полнотекстовый поиск по проектам.
+
+Индекс — отдельная таблица project_search (id проекта, заголовок, текст): в body собираются
+target, task, описание компании и тексты этапов. На PostgreSQL у неё есть генерируемая колонка
+document (tsvector, заголовок с весом A) с GIN-индексом, на SQLite это FTS5-таблица с rowid = id проекта.
+Таблицу создаёт и заполняет `python -m app.migration`; дальше её обновляют эндпоинты
+создания/изменения/импорта проектов через refresh_search_index.
+"""
+import html
+import os
+import re
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text, select, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import engine, get_session
+from .images import get_variants, load_variants
+from .models import Project, ProjectAboutCompany, ProjectStage
+from .responses import ORJSONResponse
+
+# Конфигурация текстового поиска PostgreSQL: russian стеммит русские слова, латиницу — как english
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "russian")
+MAX_SEARCH_LIMIT = 100
+MAX_QUERY_TOKENS = 10
+# Маркеры подсветки из БД; после экранирования HTML заменяются на <mark>
+_START, _STOP = "\x02", "\x03"
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+if not re.fullmatch(r"[a-z_]+", SEARCH_TS_CONFIG):
+    raise RuntimeError(f"Invalid SEARCH_TS_CONFIG: {SEARCH_TS_CONFIG!r}")
+
+
+def is_sqlite() -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+SEARCH_DDL = {
+    "postgresql": [
+        f"""
+        CREATE TABLE IF NOT EXISTS project_search (
+            project_id INTEGER PRIMARY KEY REFERENCES project(id) ON DELETE CASCADE,
+            title TEXT NOT NULL DEFAULT '',
+            body TEXT NOT NULL DEFAULT '',
+            document tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('{SEARCH_TS_CONFIG}', title), 'A') ||
+                setweight(to_tsvector('{SEARCH_TS_CONFIG}', body), 'B')
+            ) STORED
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_project_search_document ON project_search USING GIN (document)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS project_search USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')",
+    ],
+}
+
+
+def search_documents(project_ids: Optional[List[int]] = None):
+    """SELECT (id, title, body) для индекса — одним запросом для любого числа проектов"""
+    separator = literal(" ")
+    stage_text = select(
+        ProjectStage.project_id,
+        func.aggregate_strings(
+            func.coalesce(ProjectStage.title, "") + separator + func.coalesce(ProjectStage.description, ""), " "
+        ).label("text"),
+    ).group_by(ProjectStage.project_id)
+    if project_ids is not None:
+        stage_text = stage_text.where(ProjectStage.project_id.in_(project_ids))
+    stage_text = stage_text.subquery()
+
+    body = (
+        func.coalesce(Project.target, "") + separator + func.coalesce(Project.task, "") + separator
+        + func.coalesce(ProjectAboutCompany.title, "") + separator + func.coalesce(ProjectAboutCompany.description, "")
+        + separator + func.coalesce(stage_text.c.text, "")
+    )
+    stmt = (
+        select(Project.id, func.coalesce(Project.title, ""), body)
+        .outerjoin(ProjectAboutCompany, ProjectAboutCompany.project_id == Project.id)
+        .outerjoin(stage_text, stage_text.c.project_id == Project.id)
+    )
+    if project_ids is not None:
+        stmt = stmt.where(Project.id.in_(project_ids))
+    return stmt
+
+
+async def create_search_index(conn) -> bool:
+    """Создаёт project_search, если её нет. Возвращает True, если таблица только что создана"""
+    exists = await conn.run_sync(lambda sync_conn: sync_conn.dialect.has_table(sync_conn, "project_search"))
+    for ddl in SEARCH_DDL[conn.dialect.name]:
+        await conn.execute(text(ddl))
+    return not exists
+
+
+async def refresh_search_index(session: AsyncSession, project_ids: List[int]):
+    """Пересобирает записи индекса для проектов (в текущей транзакции; удалённые проекты просто исчезают)"""
+    if not project_ids:
+        return
+    key = "rowid" if is_sqlite() else "project_id"
+    ids = list(project_ids)
+    # FTS5 не поддерживает UPSERT, поэтому везде одинаково: удалить и вставить заново
+    delete_stmt = text(f"DELETE FROM project_search WHERE {key} IN ({', '.join(str(int(i)) for i in ids)})")
+    await session.execute(delete_stmt)
+    rows = (await session.execute(search_documents(ids))).all()
+    if rows:
+        await session.execute(
+            text(f"INSERT INTO project_search ({key}, title, body) VALUES (:id, :title, :body)"),
+            [{"id": r[0], "title": r[1], "body": r[2]} for r in rows],
+        )
+
+
+async def rebuild_search_index(conn):
+    """Полная пересборка индекса одним INSERT ... SELECT"""
+    key = "rowid" if conn.dialect.name == "sqlite" else "project_id"
+    await conn.execute(text("DELETE FROM project_search"))
+    select_sql = search_documents().compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    await conn.execute(text(f"INSERT INTO project_search ({key}, title, body) {select_sql}"))
+
+
+def query_tokens(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())[:MAX_QUERY_TOKENS]
+
+
+def highlight(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return html.escape(value).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+async def run_search(session: AsyncSession, tokens: List[str], limit: int, offset: int):
+    # Все слова обязательны, последнее — как префикс (поиск по мере набора)
+    if is_sqlite():
+        match = " ".join(f'"{t}"' for t in tokens) + "*"
+        # Сначала отбираем страницу по рангу, подсветку считаем только для неё:
+        # иначе SQLite вычисляет snippet для каждого совпадения до сортировки
+        sql = f"""
+            WITH hits AS (
+                SELECT rowid AS id, bm25(project_search, 5.0, 1.0) AS score
+                FROM project_search
+                WHERE project_search MATCH :match
+                ORDER BY score, rowid
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT p.id, p.title, p.preview_img, p.variants_version, -hits.score AS rank,
+                   highlight(project_search, 0, '{_START}', '{_STOP}') AS title_hl,
+                   snippet(project_search, 1, '{_START}', '{_STOP}', '…', 24) AS body_hl
+            FROM project_search
+            JOIN hits ON hits.id = project_search.rowid
+            JOIN project p ON p.id = hits.id
+            WHERE project_search MATCH :match
+            ORDER BY hits.score, p.id
+        """
+    else:
+        match = " & ".join(tokens) + ":*"
+        # ts_headline дорогой — считаем его только для строк текущей страницы
+        sql = f"""
+            WITH q AS (SELECT to_tsquery('{SEARCH_TS_CONFIG}', :match) AS query),
+            hits AS (
+                SELECT s.project_id, s.title, s.body, ts_rank_cd(s.document, q.query) AS rank
+                FROM project_search s, q
+                WHERE s.document @@ q.query
+                ORDER BY rank DESC, s.project_id
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT p.id, p.title, p.preview_img, p.variants_version, hits.rank,
+                   ts_headline('{SEARCH_TS_CONFIG}', hits.title, q.query,
+                               'StartSel={_START}, StopSel={_STOP}, HighlightAll=true') AS title_hl,
+                   ts_headline('{SEARCH_TS_CONFIG}', hits.body, q.query,
+                               'StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=24, MinWords=8, FragmentDelimiter=" … "') AS body_hl
+            FROM hits JOIN project p ON p.id = hits.project_id, q
+            ORDER BY hits.rank DESC, p.id
+        """
+    return (await session.execute(text(sql), {"match": match, "limit": limit, "offset": offset})).all()
+
+
+@router.get("/projects/search")
+async def search_projects(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0, le=10000),
+    session: AsyncSession = Depends(get_session),
+):
+    tokens = query_tokens(q)
+    if not tokens:
+        raise HTTPException(status_code=400, detail="Query must contain at least one word")
+    rows = await run_search(session, tokens, limit, offset)
+    await load_variants(session, [(row.preview_img, row.variants_version) for row in rows])
+    return ORJSONResponse({"items": [
+        {
+            "id": row.id,
+            "title": row.title,
+            "preview_img": row.preview_img,
+            "preview_img_variants": get_variants(row.preview_img),
+            "rank": float(row.rank),
+            "highlights": {"title": highlight(row.title_hl), "body": highlight(row.body_hl)},
+        }
+        for row in rows
+    ]})
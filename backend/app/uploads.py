@@ -0,0 +1,185 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
+STAGES_UPLOADS_DIR = os.path.join(UPLOADS_DIR, "stages")
+RESULTS_UPLOADS_DIR = os.path.join(UPLOADS_DIR, "results")
+# Хранилище по содержимому: uploads/blobs/<2 символа хэша>/<sha256><расширение>
+BLOBS_DIR = os.path.join(UPLOADS_DIR, "blobs")
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+
+# Тип файла определяется по первым байтам, а не по имени или заголовку клиента.
+# SVG не принимается: он может содержать скрипты и отдаётся с того же домена, что и API
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+]
+
+
+def sniff_image_type(head: bytes):
+    """Возвращает (content_type, расширение) по сигнатуре или None"""
+    for signature, content_type, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type, ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif", ".avif"
+    return None
+
+
+class UploadBudget:
+    """Суммарный лимит байт на все файлы одного запроса"""
+
+    def __init__(self, limit: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise HTTPException(status_code=413, detail="Total upload size exceeds the limit")
+
+
+def ensure_upload_dirs():
+    """Создаёт каталоги загрузок. Вызывается при старте приложения (lifespan), а не при импорте"""
+    for directory in (UPLOADS_DIR, STAGES_UPLOADS_DIR, RESULTS_UPLOADS_DIR, BLOBS_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+
+def blob_path(digest: str, ext: str) -> str:
+    return os.path.join(BLOBS_DIR, digest[:2], digest + ext)
+
+
+async def store_upload(file: Optional[UploadFile], budget: Optional[UploadBudget] = None) -> Optional[str]:
+    """Потоково пишет загрузку во временный файл и атомарно переносит его в хранилище.
+    Имя файла — SHA-256 содержимого: одинаковые загрузки хранятся один раз, а разные
+    файлы с одинаковым именем не перезаписывают друг друга. Возвращает путь относительно UPLOADS_DIR"""
+    if file is None or not getattr(file, "filename", None) or not file.filename.strip():
+        return None
+    directory = BLOBS_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    sniffed = None
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if sniffed is None:
+                    sniffed = sniff_image_type(chunk[:32])
+                    if sniffed is None:
+                        raise HTTPException(status_code=415, detail=f"Unsupported file type: {file.filename}")
+                size += len(chunk)
+                if size > UPLOAD_MAX_FILE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File is too large: {file.filename}")
+                if budget is not None:
+                    budget.consume(len(chunk))
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+        if sniffed is None:
+            raise HTTPException(status_code=400, detail=f"Empty file: {file.filename}")
+
+        final_path = blob_path(digest.hexdigest(), sniffed[1])
+        if os.path.exists(final_path):
+            # Такой файл уже есть — дедупликация. Обновляем mtime, чтобы сборщик мусора
+            # не удалил блоб до того, как ссылка на него будет сохранена в БД
+            os.remove(tmp_path)
+            os.utime(final_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # mkstemp создаёт файл с правами 0600 — статику должен читать и фронтовой прокси
+            os.chmod(tmp_path, 0o644)
+            # os.replace атомарен в пределах одной файловой системы
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.relpath(final_path, UPLOADS_DIR).replace("\\", "/")
+
+
+class RequestSizeLimitMiddleware:
+    """Обрывает запросы на загрузку, тело которых больше лимита, ещё во время приёма —
+    до того, как multipart-парсер сохранит весь поток во временные файлы"""
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES, path_prefix: str = "/api/projects",
+                 exclude_paths: tuple = ("/api/projects/import",)):
+        self.app = app
+        # Запас на текстовые поля формы и служебные заголовки multipart
+        self.max_bytes = max_bytes + 1024 * 1024
+        self.path_prefix = path_prefix
+        # Импорт NDJSON читает тело построчно и сам ограничивает размер строки
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH") \
+                or not scope["path"].startswith(self.path_prefix) or scope["path"] in self.exclude_paths:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                return await self._reject(send)
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            if too_large:
+                raise _BodyTooLarge()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if too_large:
+                # FastAPI оборачивает исключение из receive() в 400 "error parsing the body" —
+                # ответ приложения на оборванное тело отбрасываем и отвечаем 413 сами
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            # Исключение могло дойти сюда как есть или обёрнутым в другое — важен только флаг
+            if not too_large:
+                raise
+        if too_large and not response_started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body is too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class _BodyTooLarge(Exception):
+    pass
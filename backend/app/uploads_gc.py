@@ -0,0 +1,107 @@
+"""
+Сборка мусора в uploads: удаляет файлы, на которые не ссылается ни одна строка
+project / project_stage / project_result_image.
+
+    python -m app.uploads_gc            # удалить неиспользуемые блобы
+    python -m app.uploads_gc --dry-run  # только показать, что будет удалено
+    python -m app.uploads_gc --include-legacy  # также старые файлы в uploads/, stages/, results/
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from collections import Counter
+
+from sqlalchemy import select, delete, union_all
+
+from .database import SessionLocal
+from .models import Project, ProjectStage, ProjectResultImage, ImageVariants
+from .uploads import UPLOADS_DIR, BLOBS_DIR, STAGES_UPLOADS_DIR, RESULTS_UPLOADS_DIR
+from .images import variants_dir_for
+
+# Файлы моложе этого срока не трогаем: загрузка могла завершиться, а транзакция с ссылкой — ещё нет
+GC_GRACE_SECONDS = int(os.getenv("UPLOADS_GC_GRACE_SECONDS", "3600"))
+
+
+async def collect_references(session) -> Counter:
+    """Счётчики ссылок на файлы по всем колонкам с изображениями"""
+    columns = union_all(
+        select(Project.preview_img.label("path")),
+        select(Project.main_img),
+        select(Project.notebook_img),
+        select(ProjectStage.img),
+        select(ProjectResultImage.img),
+    ).subquery()
+    rows = await session.execute(select(columns.c.path).where(columns.c.path.isnot(None)))
+    return Counter(path.replace("\\", "/") for (path,) in rows)
+
+
+def iter_files(include_legacy: bool):
+    roots = [(BLOBS_DIR, True)]
+    if include_legacy:
+        roots += [(UPLOADS_DIR, False), (STAGES_UPLOADS_DIR, False), (RESULTS_UPLOADS_DIR, False)]
+    for root, recursive in roots:
+        if not os.path.isdir(root):
+            continue
+        if recursive:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    yield os.path.join(dirpath, name)
+        else:
+            for entry in os.scandir(root):
+                if entry.is_file():
+                    yield entry.path
+
+
+async def forget_variants(paths: list):
+    """Удаляет записи image_variants удалённых файлов. Тот же файл, загруженный заново, получит
+    тот же путь блоба — без этого API отдавал бы ссылки на стёртые варианты и не пересоздавал их"""
+    async with SessionLocal() as session:
+        # Кусками: у SQLite ограничено число параметров запроса
+        for start in range(0, len(paths), 500):
+            await session.execute(delete(ImageVariants).where(ImageVariants.path.in_(paths[start:start + 500])))
+        await session.commit()
+
+
+async def collect_garbage(dry_run: bool = False, include_legacy: bool = False, grace_seconds: int = GC_GRACE_SECONDS) -> dict:
+    async with SessionLocal() as session:
+        references = await collect_references(session)
+
+    cutoff = time.time() - grace_seconds
+    report = {"scanned": 0, "referenced": 0, "removed": 0, "bytes_reclaimed": 0, "skipped_recent": 0}
+    removed = []
+    for path in iter_files(include_legacy):
+        report["scanned"] += 1
+        rel_path = os.path.relpath(path, UPLOADS_DIR).replace("\\", "/")
+        if references.get(rel_path):
+            report["referenced"] += 1
+            continue
+        stat = os.stat(path)
+        if stat.st_mtime > cutoff:
+            report["skipped_recent"] += 1
+            continue
+        if not dry_run:
+            os.remove(path)
+            # Уменьшенные копии живут столько же, сколько оригинал
+            shutil.rmtree(variants_dir_for(rel_path), ignore_errors=True)
+            removed.append(rel_path)
+        report["removed"] += 1
+        report["bytes_reclaimed"] += stat.st_size
+    if removed:
+        await forget_variants(removed)
+    report["dry_run"] = dry_run
+    report["references"] = sum(references.values())
+    report["unique_references"] = len(references)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--include-legacy", action="store_true")
+    parser.add_argument("--grace-seconds", type=int, default=GC_GRACE_SECONDS)
+    args = parser.parse_args()
+    result = asyncio.run(collect_garbage(args.dry_run, args.include_legacy, args.grace_seconds))
+    for key, value in result.items():
+        print(f"{key}: {value}")
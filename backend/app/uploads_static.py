@@ -0,0 +1,97 @@
+"""
+Раздача uploads/: заголовки кэширования, сильные ETag, Range, предсжатые .br/.gz копии
+и передача файла фронт-прокси через X-Accel-Redirect (nginx) или X-Sendfile (apache, lighttpd).
+
+Файлы в blobs/ и их варианты в variants/blobs/ адресуются по содержимому и не меняются,
+поэтому отдаются с Cache-Control: immutable. Старые файлы (uploads/*.png, stages/, results/)
+браузер перепроверяет по ETag.
+"""
+import mimetypes
+import os
+from datetime import datetime, timezone
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .http_cache import http_date, accepted_encodings
+
+UPLOADS_IMMUTABLE_MAX_AGE = int(os.getenv("UPLOADS_IMMUTABLE_MAX_AGE", "31536000"))
+# "" — файл отдаёт воркер, "x-accel-redirect" — nginx, "x-sendfile" — apache/lighttpd
+UPLOADS_SENDFILE = os.getenv("UPLOADS_SENDFILE", "").strip().lower()
+# internal-location nginx, который смотрит в каталог uploads
+UPLOADS_ACCEL_PREFIX = os.getenv("UPLOADS_ACCEL_PREFIX", "/internal-uploads/")
+
+CONTENT_ADDRESSED_PREFIXES = ("blobs/", "variants/blobs/")
+# Порядок задаёт предпочтение: brotli плотнее gzip
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_content_addressed(rel_path: str) -> bool:
+    return rel_path.startswith(CONTENT_ADDRESSED_PREFIXES)
+
+
+def file_etag(rel_path: str, stat_result: os.stat_result) -> str:
+    if rel_path.startswith("blobs/"):
+        # Имя блоба — sha256 содержимого
+        return '"' + os.path.splitext(os.path.basename(rel_path))[0] + '"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def find_precompressed(full_path: str, accepted: set):
+    """Возвращает (есть ли сжатые копии, (кодировка, путь, stat) подходящей копии или None)"""
+    found = False
+    for encoding, suffix in PRECOMPRESSED:
+        try:
+            stat_result = os.stat(full_path + suffix)
+        except OSError:
+            continue
+        found = True
+        if encoding in accepted or "*" in accepted:
+            return True, (encoding, full_path + suffix, stat_result)
+    return found, None
+
+
+class UploadsStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        rel_path = os.path.relpath(full_path, os.path.realpath(self.directory)).replace("\\", "/")
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+        headers = {}
+        if is_content_addressed(rel_path):
+            headers["Cache-Control"] = f"public, max-age={UPLOADS_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            headers["Cache-Control"] = "no-cache"
+        etag = file_etag(rel_path, stat_result)
+
+        has_precompressed, precompressed = False, None
+        # Прокси сам выбирает .br/.gz (gzip_static / brotli_static), ему отдаём исходный путь
+        if UPLOADS_SENDFILE != "x-accel-redirect":
+            try:
+                accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            except ValueError:
+                accepted = set()
+            has_precompressed, precompressed = find_precompressed(full_path, accepted)
+        if has_precompressed:
+            headers["Vary"] = "Accept-Encoding"
+        if precompressed is not None:
+            encoding, full_path, stat_result = precompressed
+            rel_path += os.path.splitext(full_path)[1]
+            headers["Content-Encoding"] = encoding
+            # У каждого представления свой ETag, иначе Range/If-Range смешают байты разных кодировок
+            etag = etag[:-1] + "-" + encoding + '"'
+
+        headers["ETag"] = etag
+        headers["Last-Modified"] = http_date(datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc))
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+
+        if UPLOADS_SENDFILE == "x-accel-redirect":
+            # Файл, Range и медленных клиентов обслуживает nginx, воркер сразу освобождается
+            headers["X-Accel-Redirect"] = UPLOADS_ACCEL_PREFIX.rstrip("/") + "/" + rel_path
+            return Response(status_code=status_code, headers=headers, media_type=media_type)
+        if UPLOADS_SENDFILE == "x-sendfile":
+            headers["X-Sendfile"] = full_path
+            return Response(status_code=status_code, headers=headers, media_type=media_type)
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers, media_type=media_type)
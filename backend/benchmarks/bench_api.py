@@ -0,0 +1,356 @@
+"""
+Воспроизводимый бенчмарк основных сценариев API с сохранением результатов в JSON.
+
+Заполняет базу (по умолчанию временная SQLite; для PostgreSQL укажите DATABASE_URL на пустую базу)
+заданным числом проектов, этапов и пользователей и гоняет настоящее приложение app.main:app:
+  - inprocess — в том же процессе через httpx + ASGI (без сети, видно стоимость самого кода);
+  - uvicorn   — поднимает uvicorn отдельным процессом и ходит по HTTP (--workers воркеров).
+
+Сценарии: list (GET /api/projects), full (GET /api/projects/{id}), login, refresh
+(цепочкой: каждый запрос — с токеном из предыдущего ответа) и update (PATCH /api/projects/{id}).
+Для каждого — пропускная способность, p50/p95/p99 и коды ответов.
+
+Результат пишется в benchmarks/results/<время>_<коммит>.json вместе с коммитом, версией Python
+и параметрами запуска; --compare печатает разницу с другим прогоном.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_api --projects 1000 --stages 5 --users 100 --mode inprocess uvicorn
+    python -m benchmarks.bench_api --compare benchmarks/results/base.json
+    python -m benchmarks.bench_api --compare benchmarks/results/base.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_api_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+os.environ.setdefault("DB_ECHO", "false")
+# Все запросы идут с одного адреса: с лимитами авторизации сценарии login/refresh мерили бы 429
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+PASSWORD = "bench"
+SCENARIOS = ("list", "full", "login", "refresh", "update")
+
+
+async def seed(projects, stages, users, batch_size=1000):
+    from sqlalchemy import func, insert, select, text
+    from app.database import engine
+    from app.models import (Base, Project, ProjectAboutCompany, ProjectStage, ProjectResult,
+                            ProjectResultImage, ProjectProgress, Role, User, user_roles)
+    from app.search import create_search_index, rebuild_search_index
+    from app.utils import hash_password
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await create_search_index(conn)
+        if (await conn.execute(select(func.count()).select_from(Project))).scalar():
+            raise SystemExit("В базе уже есть проекты — укажите DATABASE_URL на пустую базу")
+
+    # Без путей к картинкам: файлов нет, и update ставил бы в очередь генерацию вариантов для каждого
+    for start in range(0, projects, batch_size):
+        ids = range(start + 1, min(projects, start + batch_size) + 1)
+        async with engine.begin() as conn:
+            await conn.execute(insert(Project), [
+                {"id": i, "title": f"Project {i}", "url": f"https://example.com/{i}",
+                 "target": "target " * 20, "task": "task " * 20}
+                for i in ids
+            ])
+            await conn.execute(insert(ProjectAboutCompany), [
+                {"project_id": i, "title": f"Company {i}", "description": "about " * 30} for i in ids
+            ])
+            if stages:
+                await conn.execute(insert(ProjectStage), [
+                    {"project_id": i, "title": f"Stage {s}", "description": "stage " * 30}
+                    for i in ids for s in range(stages)
+                ])
+            await conn.execute(insert(ProjectProgress), [
+                {"project_id": i, "digit": d, "text": f"progress {d}"} for i in ids for d in range(3)
+            ])
+            await conn.execute(insert(ProjectResult), [{"id": i, "project_id": i, "description": "result " * 20} for i in ids])
+            await conn.execute(insert(ProjectResultImage), [
+                {"result_id": i, "type": t} for i in ids for t in ("tablet", "smartphone")
+            ])
+
+    # Один хэш на всех: bcrypt на каждого пользователя занял бы минуты
+    password_hash = hash_password(PASSWORD)
+    async with engine.begin() as conn:
+        await conn.execute(insert(Role), [{"id": 1, "name": "admin"}])
+        for start in range(0, users, batch_size):
+            ids = range(start + 1, min(users, start + batch_size) + 1)
+            await conn.execute(insert(User), [
+                {"id": i, "email": f"user{i}@bench.local", "password_hash": password_hash, "role_ids": "1"} for i in ids
+            ])
+            await conn.execute(insert(user_roles), [{"user_id": i, "role_id": 1} for i in ids])
+        await rebuild_search_index(conn)
+        if conn.dialect.name == "postgresql":
+            # id вставлены явно — двигаем последовательности, иначе следующий INSERT получит занятый id
+            for table in ("project", "project_result", "roles", "users"):
+                await conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"))
+            await conn.execute(text("ANALYZE"))
+    await engine.dispose()
+
+
+class Scenario:
+    """Запрос сценария и подготовка состояния воркера (токены), которая не входит в замер"""
+
+    def __init__(self, request, prepare=None, auth=False):
+        self.request = request
+        self.prepare = prepare
+        self.auth = auth
+
+
+async def login(client, user_id):
+    response = await client.post("/api/auth/login", data={"email": f"user{user_id}@bench.local", "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()
+
+
+def make_scenarios(args):
+    async def list_projects(client, state, i):
+        return await client.get("/api/projects")
+
+    async def full_project(client, state, i):
+        return await client.get(f"/api/projects/{i % args.projects + 1}")
+
+    async def login_user(client, state, i):
+        return await client.post("/api/auth/login", data={"email": f"user{i % args.users + 1}@bench.local", "password": PASSWORD})
+
+    async def prepare_refresh(client, state, worker):
+        state["refresh_token"] = (await login(client, worker % args.users + 1))["refresh_token"]
+
+    async def refresh(client, state, i):
+        response = await client.post("/api/auth/refresh", data={"refresh_token": state["refresh_token"]})
+        state["refresh_token"] = response.headers.get("X-Refresh-Token", state["refresh_token"])
+        return response
+
+    async def prepare_update(client, state, worker):
+        state["headers"] = {"Authorization": f"Bearer {(await login(client, 1))['access_token']}"}
+
+    async def update(client, state, i):
+        project_id = i % args.projects + 1
+        return await client.patch(f"/api/projects/{project_id}", headers=state["headers"],
+                                  data={"title": f"Project {project_id} rev {i}"})
+
+    return {
+        "list": Scenario(list_projects),
+        "full": Scenario(full_project),
+        "login": Scenario(login_user, auth=True),
+        "refresh": Scenario(refresh, prepare_refresh),
+        # Последним: изменения сбрасывают кэш проектов
+        "update": Scenario(update, prepare_update),
+    }
+
+
+def summarize(latencies, elapsed, statuses):
+    # statistics.quantiles(method="inclusive") — линейная интерполяция между соседними замерами
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(max(latencies), 3),
+        "statuses": {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+    }
+
+
+async def run_scenario(client, scenario, total, concurrency, warmup):
+    """Замкнутый цикл: concurrency воркеров, каждый шлёт следующий запрос после ответа на предыдущий"""
+    states = [{} for _ in range(concurrency)]
+    if scenario.prepare:
+        for worker, state in enumerate(states):
+            await scenario.prepare(client, state, worker)
+    for i in range(warmup):
+        await scenario.request(client, states[i % concurrency], i)
+
+    latencies = []
+    statuses = collections.Counter()
+    counter = itertools.count()
+
+    async def worker(state):
+        while (i := next(counter)) < total:
+            started = time.perf_counter()
+            try:
+                response = await scenario.request(client, state, i)
+            except httpx.TransportError:
+                # Сервер оборвал соединение — считаем как ошибку, а не прерываем весь прогон
+                statuses["error"] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(state) for state in states))
+    return summarize(latencies, time.perf_counter() - started, statuses)
+
+
+async def run_all(client, args):
+    results = {}
+    for name, scenario in make_scenarios(args).items():
+        if name not in args.scenarios:
+            continue
+        total = args.auth_requests if scenario.auth else args.requests
+        result = await run_scenario(client, scenario, total, args.concurrency, min(args.warmup, total))
+        results[name] = result
+        print(f"{name:>8} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f}  {result['statuses']}")
+    return results
+
+
+async def run_inprocess(args):
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            return await run_all(client, args)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                if server.poll() is not None:
+                    raise SystemExit(f"uvicorn завершился с кодом {server.returncode}")
+                try:
+                    # /health/* требуют admin — готовность проверяем публичным списком проектов
+                    if (await client.get("/api/projects")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise SystemExit("uvicorn не поднялся за 30 с")
+                await asyncio.sleep(0.2)
+            return await run_all(client, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_info():
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def compare(base, new):
+    print(f"\nСравнение: {(base['meta'].get('commit') or '?')[:8]} -> {(new['meta'].get('commit') or '?')[:8]}")
+    print(f"{'mode':>10} {'scenario':>8} {'rps':>18} {'p95 ms':>20}")
+
+    def delta(old, value):
+        return f"{(value - old) / old * 100:+.1f}%" if old else "—"
+
+    for mode, scenarios in new["results"].items():
+        for name, result in scenarios.items():
+            old = base["results"].get(mode, {}).get(name)
+            if old is None:
+                continue
+            print(f"{mode:>10} {name:>8} {old['rps']:>8.1f}→{result['rps']:<8.1f}{delta(old['rps'], result['rps']):>8} "
+                  f"{old['p95_ms']:>7.2f}→{result['p95_ms']:<7.2f}{delta(old['p95_ms'], result['p95_ms']):>8}")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def main(args):
+    if args.compare and len(args.compare) == 2:
+        compare(load(args.compare[0]), load(args.compare[1]))
+        return
+
+    from app.database import engine
+    dialect = engine.dialect.name
+    started = time.perf_counter()
+    await seed(args.projects, args.stages, args.users)
+    print(f"Заполнение ({dialect}): {args.projects} проектов × {args.stages} этапов, "
+          f"{args.users} пользователей за {time.perf_counter() - started:.1f} с")
+
+    report = {
+        "meta": {
+            **git_info(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": dialect,
+            "project_cache_size": os.getenv("PROJECT_CACHE_SIZE"),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": {},
+    }
+    runners = {"inprocess": run_inprocess, "uvicorn": run_uvicorn}
+    for mode in args.mode:
+        print(f"\n== {mode}\n{'scenario':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+        report["results"][mode] = await runners[mode](args)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{(report['meta']['commit'] or 'nogit')[:8]}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты: {output}")
+
+    if args.compare:
+        compare(load(args.compare[0]), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--stages", type=int, default=5, help="Этапов на проект")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000, help="Запросов на сценарий чтения/изменения")
+    parser.add_argument("--auth-requests", type=int, default=200, help="Запросов на login (bcrypt дорогой)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20, help="Запросов на прогрев перед замером")
+    parser.add_argument("--mode", nargs="+", choices=["inprocess", "uvicorn"], default=["inprocess"])
+    parser.add_argument("--workers", type=int, default=1, help="Воркеров uvicorn")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--no-cache", action="store_true", help="Отключить кэш проектов (PROJECT_CACHE_SIZE=0)")
+    parser.add_argument("--output", help="Файл результатов (по умолчанию benchmarks/results/<время>_<коммит>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="Сравнить с прошлым прогоном; с двумя файлами — только сравнение, без запуска")
+    parsed = parser.parse_args()
+    if parsed.no_cache:
+        # До импорта приложения: настройки читаются при импорте, их же наследует процесс uvicorn
+        os.environ["PROJECT_CACHE_SIZE"] = "0"
+    asyncio.run(main(parsed))
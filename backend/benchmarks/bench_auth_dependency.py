@@ -0,0 +1,48 @@
+"""
+Микробенчмарк зависимости get_current_user: стоимость на запрос с кэшем
+проверенных токенов и без него.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_auth_dependency --iterations 20000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# БД не используется, но модуль database создаёт движок при импорте
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from app.dependencies import get_current_user, role_required, token_cache  # noqa: E402
+from app.roles import role_registry  # noqa: E402
+from app.utils import create_access_token  # noqa: E402
+
+
+async def measure(token, iterations, use_cache):
+    check_admin = role_required("admin")
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if not use_cache:
+            token_cache.clear()
+        user = await get_current_user(token)
+        await check_admin(user)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def main(iterations):
+    # Справочник ролей заполняется вручную, чтобы бенчмарк не зависел от БД
+    role_registry.load([(1, "admin"), (2, "editor")])
+    token = create_access_token({"user_id": 1, "roles": ["admin"], "role_ids": [1]})
+
+    without_cache = await measure(token, iterations, use_cache=False)
+    with_cache = await measure(token, iterations, use_cache=True)
+    print(f"без кэша: {without_cache:8.2f} мкс/запрос")
+    print(f"с кэшем:  {with_cache:8.2f} мкс/запрос")
+    print(f"ускорение: x{without_cache / with_cache:.1f}")
+    print("кэш:", token_cache.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    asyncio.run(main(parser.parse_args().iterations))
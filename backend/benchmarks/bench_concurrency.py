@@ -0,0 +1,109 @@
+"""
+Нагрузочный бенчмарк чтения проектов при высокой конкурентности.
+
+Поднимает приложение в процессе (httpx + ASGI) на временной SQLite базе, либо бьёт
+в уже запущенный сервер через --url, и печатает p50/p95/p99 задержки для
+GET /api/projects и GET /api/projects/{id} на разных уровнях конкурентности.
+Кэш проектов отключён, чтобы измерялась работа с БД.
+
+Для сравнения синхронной и асинхронной версии запустите скрипт на двух коммитах.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_concurrency --projects 200 --requests 2000 --concurrency 10 100 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_conc_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+os.environ.setdefault("PROJECT_CACHE_SIZE", "0")
+
+import httpx  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def seed(total):
+    from app.database import engine, SessionLocal
+    from app.models import Base, Project, ProjectAboutCompany, ProjectStage, ProjectResult, ProjectResultImage, ProjectProgress
+
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        for i in range(total):
+            session.add(Project(
+                title=f"Project {i}", url=f"https://example.com/{i}", preview_img=f"preview_{i}.png",
+                target="target " * 20, task="task " * 20,
+                about_company=ProjectAboutCompany(title=f"Company {i}", description="about " * 30),
+                stages=[ProjectStage(title=f"Stage {s}", description="stage " * 30, img=f"stages/{i}_{s}.png") for s in range(5)],
+                result=ProjectResult(description="result " * 20, images=[
+                    ProjectResultImage(type="tablet", img=f"results/{i}_t.png"),
+                    ProjectResultImage(type="smartphone", img=f"results/{i}_s.png"),
+                ]),
+                progresses=[ProjectProgress(digit=d, text=f"progress {d}") for d in range(3)],
+            ))
+        await session.commit()
+
+
+async def run_level(client, paths, total_requests, concurrency):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(paths[i % len(paths)])
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": total_requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+
+async def main(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60, limits=httpx.Limits(max_connections=max(args.concurrency)))
+    else:
+        await seed(args.projects)
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    scenarios = {
+        "list": ["/api/projects"],
+        "full": [f"/api/projects/{i}" for i in range(1, args.projects + 1)],
+    }
+    print(f"{'scenario':>8} {'conc':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    async with client:
+        for name, paths in scenarios.items():
+            for concurrency in args.concurrency:
+                r = await run_level(client, paths, args.requests, concurrency)
+                print(f"{name:>8} {concurrency:>6} {r['rps']:>9.1f} {r['p50']:>9.2f} {r['p95']:>9.2f} {r['p99']:>9.2f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--url", help="Адрес запущенного сервера, например http://127.0.0.1:8000")
+    asyncio.run(main(parser.parse_args()))
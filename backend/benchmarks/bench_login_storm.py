@@ -0,0 +1,109 @@
+"""
+Бенчмарк: задержка чтения проектов во время шквала логинов.
+
+Сначала измеряет GET /api/projects/{id} без нагрузки, затем те же запросы
+параллельно с потоком POST /api/auth/login. bcrypt выполняется в пуле процессов
+(app/passwords.py), поэтому задержка чтения не должна заметно расти, а лишние
+логины сверх PASSWORD_QUEUE_LIMIT получают 503.
+
+По умолчанию лимиты авторизации (app/rate_limit.py) выключены, чтобы шквал дошёл до bcrypt;
+с --rate-limit видно, как перебор с одного адреса отсекается ответами 429 ещё до bcrypt.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_login_storm --logins 200 --login-concurrency 50
+    python -m benchmarks.bench_login_storm --logins 2000 --rate-limit
+"""
+import argparse
+import asyncio
+import collections
+import os
+import statistics
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_login_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+os.environ.setdefault("PROJECT_CACHE_SIZE", "0")
+
+import httpx  # noqa: E402
+
+from benchmarks.bench_concurrency import percentile, seed  # noqa: E402
+
+
+async def seed_user():
+    from app.database import SessionLocal
+    from app.models import Role, User
+    from app.utils import hash_password
+
+    async with SessionLocal() as session:
+        session.add(Role(id=1, name="admin"))
+        session.add(User(email="bench@example.com", password_hash=hash_password("bench"), role_ids="1"))
+        await session.commit()
+
+
+async def measure_reads(client, total, concurrency, projects):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await client.get(f"/api/projects/{i % projects + 1}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies
+
+
+async def login_storm(client, total, concurrency):
+    statuses = collections.Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            response = await client.post("/api/auth/login", data={"email": "bench@example.com", "password": "bench"})
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return statuses
+
+
+def report(name, latencies):
+    print(f"{name:>16} p50={statistics.median(latencies):8.2f} ms  p95={percentile(latencies, 95):8.2f} ms  "
+          f"p99={percentile(latencies, 99):8.2f} ms")
+
+
+async def main(args):
+    await seed(args.projects)
+    await seed_user()
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            # Прогрев пула процессов bcrypt
+            await client.post("/api/auth/login", data={"email": "bench@example.com", "password": "bench"})
+
+            baseline = await measure_reads(client, args.reads, args.read_concurrency, args.projects)
+            storm = asyncio.create_task(login_storm(client, args.logins, args.login_concurrency))
+            await asyncio.sleep(0)
+            under_storm = await measure_reads(client, args.reads, args.read_concurrency, args.projects)
+            statuses = await storm
+
+    report("reads (idle)", baseline)
+    report("reads (storm)", under_storm)
+    print("login statuses:", dict(statuses))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--read-concurrency", type=int, default=10)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--rate-limit", action="store_true", help="Не отключать лимиты авторизации")
+    parsed = parser.parse_args()
+    # До импорта приложения: настройки читаются при импорте
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "true" if parsed.rate_limit else "false")
+    asyncio.run(main(parsed))
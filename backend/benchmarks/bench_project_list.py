@@ -0,0 +1,70 @@
+"""
+Бенчмарк списка проектов (GET /api/projects).
+
+Заполняет временную SQLite базу проектами и считает количество SQL-запросов
+(app.metrics.track_queries), время в БД и время построения списка. Число запросов не должно расти вместе с таблицей.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_project_list --sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_list_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.database import engine, SessionLocal  # noqa: E402
+from app.metrics import track_queries  # noqa: E402
+from app.models import Base, Project, ProjectResult  # noqa: E402
+from app.projects import fetch_project_list, serialize_project_list_row  # noqa: E402
+
+engine.sync_engine.echo = False
+
+
+async def seed(session, total):
+    await session.execute(delete(ProjectResult))
+    await session.execute(delete(Project))
+    await session.commit()
+    for i in range(total):
+        session.add(Project(
+            title=f"Project {i}",
+            url=f"https://example.com/{i}",
+            preview_img=f"preview_{i}.png",
+            result=ProjectResult(description=f"Result {i}"),
+        ))
+        if i % 1000 == 999:
+            await session.flush()
+    await session.commit()
+
+
+async def run(sizes):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    rows = []
+    for size in sizes:
+        async with SessionLocal() as session:
+            await seed(session, size)
+        async with SessionLocal() as session:
+            with track_queries() as stats:
+                started = time.perf_counter()
+                payload = [serialize_project_list_row(row) for row in await fetch_project_list(session)]
+                elapsed = time.perf_counter() - started
+        rows.append((size, len(payload), stats.statements, stats.db_time * 1000, elapsed * 1000))
+    await engine.dispose()
+
+    print(f"{'projects':>10} {'rows':>8} {'queries':>8} {'db ms':>10} {'ms':>10}")
+    for size, count, queries, db_ms, ms in rows:
+        print(f"{size:>10} {count:>8} {queries:>8} {db_ms:>10.2f} {ms:>10.2f}")
+    if len({queries for _, _, queries, _, _ in rows}) != 1:
+        raise SystemExit("Количество запросов зависит от размера таблицы (N+1)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    asyncio.run(run(parser.parse_args().sizes))
@@ -0,0 +1,96 @@
+"""
+Бенчмарк размера и сериализации ответа GET /api/projects/{id} для «тяжёлого» проекта
+(много этапов и картинок результата).
+
+Печатает:
+  - время сериализации: jsonable_encoder + стандартный json против orjson напрямую;
+  - байты на проводе через приложение для Accept-Encoding: identity / gzip / br.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_response_size --stages 200 --images 100 --repeat 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_resp_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+os.environ.setdefault("PROJECT_CACHE_SIZE", "0")
+
+import httpx  # noqa: E402
+
+
+async def seed(stages, images):
+    from app.database import engine, SessionLocal
+    from app.models import Base, Project, ProjectAboutCompany, ProjectStage, ProjectResult, ProjectResultImage, ProjectProgress
+
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        project = Project(
+            title="Heavy project", url="https://example.com/heavy", preview_img="preview.png",
+            target="target " * 50, task="task " * 50,
+            about_company=ProjectAboutCompany(title="Company", description="about " * 100),
+            stages=[ProjectStage(title=f"Stage {s}", description=f"Описание этапа {s} " * 20, img=f"stages/{s}.png") for s in range(stages)],
+            result=ProjectResult(description="result " * 50, images=[
+                ProjectResultImage(type="tablet" if i % 2 else "smartphone", img=f"results/{i}.png") for i in range(images)
+            ]),
+            progresses=[ProjectProgress(digit=d, text=f"progress {d}") for d in range(10)],
+        )
+        session.add(project)
+        await session.commit()
+        return project.id
+
+
+def time_per_call(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def main(args):
+    project_id = await seed(args.stages, args.images)
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.database import SessionLocal
+    from app.projects import fetch_full_project, serialize_project
+    from app.responses import ORJSONResponse
+
+    async with SessionLocal() as session:
+        project = await fetch_full_project(session, project_id)
+    data = serialize_project(project)
+
+    print(f"Проект: {args.stages} этапов, {args.images} картинок результата\n")
+    print(f"{'serializer':>28} {'ms/op':>9} {'bytes':>9}")
+    rows = [
+        ("jsonable_encoder + json", lambda: JSONResponse(jsonable_encoder(data)).body),
+        ("orjson", lambda: ORJSONResponse(data).body),
+        ("serialize_project + orjson", lambda: ORJSONResponse(serialize_project(project)).body),
+    ]
+    for name, fn in rows:
+        print(f"{name:>28} {time_per_call(fn, args.repeat):>9.3f} {len(fn()):>9}")
+
+    from app.main import app
+    print(f"\n{'Accept-Encoding':>16} {'encoding':>9} {'wire bytes':>11} {'ms/req':>9}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for accept in ("identity", "gzip", "br"):
+            headers = {"Accept-Encoding": accept}
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                response = await client.get(f"/api/projects/{project_id}", headers=headers)
+            elapsed = (time.perf_counter() - started) / args.requests * 1000
+            print(f"{accept:>16} {response.headers.get('content-encoding', '-'):>9} {response.num_bytes_downloaded:>11} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=int, default=200)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
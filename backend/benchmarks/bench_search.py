@@ -0,0 +1,114 @@
+"""
+Бенчмарк полнотекстового поиска GET /api/projects/search на синтетических проектах.
+
+Заполняет базу (по умолчанию 50 000 проектов с компанией и этапами) пачками executemany,
+строит индекс project_search и печатает p50/p95/p99 задержки для запросов разной
+селективности: частое слово, редкое слово, префикс, несколько слов.
+
+По умолчанию — временная SQLite (FTS5). Для PostgreSQL (tsvector + GIN) укажите DATABASE_URL
+на пустую базу.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_search --projects 50000 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bench_search_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+
+import httpx  # noqa: E402
+
+from benchmarks.bench_concurrency import percentile  # noqa: E402
+
+COMMON_WORDS = ["сайт", "магазин", "приложение", "дизайн", "разработка", "платформа", "сервис", "интеграция"]
+RARE_WORDS = [f"редкий{i}" for i in range(50)]
+SYLLABLES = ["ка", "ло", "ми", "ра", "то", "не", "ве", "ст", "ко", "да", "пре", "ин", "ор", "ал", "ту"]
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def sentence(rng, vocabulary, length):
+    words = [rng.choice(vocabulary) for _ in range(length)]
+    words[rng.randrange(length)] = rng.choice(COMMON_WORDS)
+    if rng.random() < 0.001:
+        words[rng.randrange(length)] = rng.choice(RARE_WORDS)
+    return " ".join(words)
+
+
+async def seed(total, stages_per_project, batch_size=2000):
+    from sqlalchemy import insert
+    from app.database import engine
+    from app.models import Base, Project, ProjectAboutCompany, ProjectStage
+    from app.search import create_search_index, rebuild_search_index
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(5000, rng)
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await create_search_index(conn)
+
+    for start in range(0, total, batch_size):
+        ids = range(start + 1, min(total, start + batch_size) + 1)
+        async with engine.begin() as conn:
+            await conn.execute(insert(Project), [
+                {"id": i, "title": f"Проект {i} {sentence(rng, vocabulary, 3)}", "url": f"https://example.com/{i}",
+                 "target": sentence(rng, vocabulary, 15), "task": sentence(rng, vocabulary, 15)}
+                for i in ids
+            ])
+            await conn.execute(insert(ProjectAboutCompany), [
+                {"project_id": i, "title": f"Компания {i}", "description": sentence(rng, vocabulary, 30)} for i in ids
+            ])
+            await conn.execute(insert(ProjectStage), [
+                {"project_id": i, "title": f"Этап {s}", "description": sentence(rng, vocabulary, 20)}
+                for i in ids for s in range(stages_per_project)
+            ])
+
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        await rebuild_search_index(conn)
+    return time.perf_counter() - started
+
+
+async def main(args):
+    started = time.perf_counter()
+    index_seconds = await seed(args.projects, args.stages)
+    print(f"Заполнение: {args.projects} проектов за {time.perf_counter() - started:.1f} с, из них индекс {index_seconds:.1f} с\n")
+
+    from app.main import app
+    queries = {
+        "частое слово": "магазин",
+        "редкое слово": "редкий7",
+        "префикс": "разраб",
+        "два слова": "дизайн сервис",
+        "нет совпадений": "несуществующееслово",
+    }
+    print(f"{'запрос':>16} {'найдено':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for name, q in queries.items():
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                response = await client.get("/api/projects/search", params={"q": q, "limit": 20})
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+            found = len(response.json()["items"])
+            print(f"{name:>16} {found:>8} {percentile(latencies, 50):>9.2f} {percentile(latencies, 95):>9.2f} {percentile(latencies, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=50000)
+    parser.add_argument("--stages", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""
+Бенчмарк старта воркера: сколько проходит от запуска процесса до первого ответа.
+
+Для каждого запуска меряет:
+  - import   — импорт app.main (FastAPI, SQLAlchemy, все роутеры);
+  - lifespan — старт приложения: каталоги uploads, прогрев БД, ролей и кэша (STARTUP_WARMUP);
+  - ready    — от запуска процесса (или fork) до готовности принимать запросы;
+  - first / second — первый и повторный GET /api/projects/1, list — GET /api/projects.
+
+Режимы:
+  - spawn — каждый воркер — новый интерпретатор (uvicorn --workers, перезапуск контейнера);
+  - fork  — приложение импортировано один раз, воркеры получают его через fork (gunicorn --preload).
+Каждый режим прогоняется с прогревом и без него.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_startup --runs 5 --projects 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_api import BACKEND_DIR, seed  # noqa: E402  (задаёт временную DATABASE_URL)
+
+import httpx  # noqa: E402
+
+PHASES = ("import_ms", "lifespan_ms", "ready_ms", "first_ms", "second_ms", "list_ms")
+
+
+async def measure_worker(started_at: float) -> dict:
+    from app.main import app
+
+    result = {}
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        result["lifespan_ms"] = (time.perf_counter() - started) * 1000
+        result["ready_ms"] = (time.time() - started_at) * 1000
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for name, path in (("first_ms", "/api/projects/1"), ("second_ms", "/api/projects/1"), ("list_ms", "/api/projects")):
+                started = time.perf_counter()
+                response = await client.get(path)
+                result[name] = (time.perf_counter() - started) * 1000
+                response.raise_for_status()
+    return result
+
+
+def child(started_at: float):
+    """Режим spawn: запускается отдельным интерпретатором и печатает замеры в JSON"""
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    import_ms = (time.perf_counter() - started) * 1000
+    result = asyncio.run(measure_worker(started_at))
+    print(json.dumps({"import_ms": import_ms, **result}))
+
+
+def run_spawn(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", str(time.time())],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_fork() -> dict:
+    """Режим fork: app.main уже импортирован в этом процессе, как в мастере gunicorn --preload"""
+    read_fd, write_fd = os.pipe()
+    started_at = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = json.dumps({"import_ms": 0.0, **asyncio.run(measure_worker(started_at))}).encode()
+            os.write(write_fd, payload)
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as pipe:
+        payload = pipe.read()
+    os.waitpid(pid, 0)
+    return json.loads(payload)
+
+
+def main(args):
+    os.environ.setdefault("PROJECT_CACHE_SIZE", "512")
+    started = time.perf_counter()
+    asyncio.run(seed(args.projects, args.stages, args.users))
+    print(f"Заполнение: {args.projects} проектов за {time.perf_counter() - started:.1f} с\n")
+
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    print(f"Импорт app.main в мастере (для fork): {(time.perf_counter() - started) * 1000:.0f} мс\n")
+
+    print(f"{'mode':>6} {'warmup':>7} " + " ".join(f"{phase[:-3]:>9}" for phase in PHASES) + "   (медианы, мс)")
+    report = {}
+    for mode in args.mode:
+        for warmup in (True, False):
+            os.environ["STARTUP_WARMUP"] = "true" if warmup else "false"
+            if mode == "fork":
+                # Настройки читаются при импорте — в уже импортированном модуле меняем напрямую
+                app.main.STARTUP_WARMUP = warmup
+            runs = [run_spawn(os.environ.copy()) if mode == "spawn" else run_fork() for _ in range(args.runs)]
+            medians = {phase: round(statistics.median(run[phase] for run in runs), 2) for phase in PHASES}
+            report[f"{mode}/{'warm' if warmup else 'cold'}"] = medians
+            print(f"{mode:>6} {'on' if warmup else 'off':>7} " + " ".join(f"{medians[p]:>9.1f}" for p in PHASES))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": report}, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--stages", type=int, default=5)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--mode", nargs="+", choices=["spawn", "fork"], default=["spawn", "fork"])
+    parser.add_argument("--output", help="Сохранить медианы в JSON")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.child is not None:
+        child(parsed.child)
+    else:
+        main(parsed)
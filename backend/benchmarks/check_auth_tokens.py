@@ -0,0 +1,58 @@
+"""
+Проверка разделения токенов: refresh-токен не принимается как Bearer, access-токен —
+как refresh, а токены отозванной сессии перестают работать. Гоняет настоящее приложение
+через httpx + ASGI на временной SQLite. При нарушении завершается с кодом 1 — его можно
+ставить в CI как регрессионный тест авторизации.
+
+Запуск из папки backend:
+    python -m benchmarks.check_auth_tokens
+"""
+import asyncio
+import sys
+
+from benchmarks.bench_api import PASSWORD, seed  # noqa: E402  (задаёт временную DATABASE_URL, выключает лимиты)
+
+import httpx  # noqa: E402
+
+
+async def run_checks() -> list:
+    await seed(1, 1, 1)
+    from app.main import app
+
+    failures = []
+
+    def expect(name, response, status):
+        ok = response.status_code == status
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {response.status_code} (ожидался {status})")
+        if not ok:
+            failures.append(name)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://check") as client:
+            login = (await client.post("/api/auth/login", data={"email": "user1@bench.local", "password": PASSWORD})).json()
+            access, refresh = login["access_token"], login["refresh_token"]
+
+            expect("access-токен как Bearer", await client.get("/api/admin/users", headers={"Authorization": f"Bearer {access}"}), 200)
+            expect("refresh-токен как Bearer", await client.get("/api/admin/users", headers={"Authorization": f"Bearer {refresh}"}), 401)
+            expect("access-токен как refresh", await client.post("/api/auth/refresh", data={"refresh_token": access}), 401)
+
+            rotated = await client.post("/api/auth/refresh", data={"refresh_token": refresh})
+            expect("ротация refresh-токена", rotated, 200)
+            # Повторное предъявление отзывает всю сессию, включая выданный при ротации токен
+            expect("повторное использование", await client.post("/api/auth/refresh", data={"refresh_token": refresh}), 401)
+            revoked = rotated.headers["X-Refresh-Token"]
+            expect("отозванный refresh-токен как Bearer", await client.get("/api/admin/users", headers={"Authorization": f"Bearer {revoked}"}), 401)
+            expect("отозванный refresh-токен", await client.post("/api/auth/refresh", data={"refresh_token": revoked}), 401)
+    return failures
+
+
+def main():
+    failures = asyncio.run(run_checks())
+    if failures:
+        print(f"\nПровалено проверок: {len(failures)}")
+        sys.exit(1)
+    print("\nВсе проверки пройдены")
+
+
+if __name__ == "__main__":
+    main()
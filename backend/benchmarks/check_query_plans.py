@@ -0,0 +1,183 @@
+"""
+Проверка планов горячих запросов: заполняет большую базу, прогоняет реальные функции
+приложения (страница списка, полный проект, пользователь по email, фильтр по роли),
+перехватывает выполненный SQL и делает для него EXPLAIN. Если где-то полный проход
+по таблице (SQLite: «SCAN <таблица>» без индекса, PostgreSQL: Seq Scan), скрипт
+завершается с кодом 1 — его можно ставить в CI как регрессионный тест индексов.
+
+По умолчанию — временная SQLite; для PostgreSQL укажите DATABASE_URL на пустую базу.
+
+Запуск из папки backend:
+    python -m benchmarks.check_query_plans --projects 20000 --users 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+_tmp_dir = tempfile.mkdtemp(prefix="check_plans_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'plans.db')}")
+os.environ.setdefault("PROJECT_CACHE_SIZE", "0")
+
+from sqlalchemy import event, insert, select, text  # noqa: E402
+
+
+async def seed(projects, users, batch_size=2000):
+    from app.database import engine
+    from app.models import (Base, Project, ProjectAboutCompany, ProjectStage, ProjectResult,
+                            ProjectResultImage, ProjectProgress, Role, User, user_roles)
+    from app.migration import migrate_indexes
+
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Как на существующей базе: индексы досоздаёт миграция
+    await migrate_indexes()
+
+    for start in range(0, projects, batch_size):
+        ids = range(start + 1, min(projects, start + batch_size) + 1)
+        async with engine.begin() as conn:
+            await conn.execute(insert(Project), [
+                {"id": i, "title": f"Project {i}", "url": f"https://example.com/{i}", "preview_img": f"p{i}.png"} for i in ids
+            ])
+            await conn.execute(insert(ProjectAboutCompany), [{"project_id": i, "title": f"Company {i}"} for i in ids])
+            await conn.execute(insert(ProjectStage), [
+                {"project_id": i, "title": f"Stage {s}", "description": "text"} for i in ids for s in range(5)
+            ])
+            await conn.execute(insert(ProjectProgress), [{"project_id": i, "digit": d, "text": "x"} for i in ids for d in range(3)])
+            await conn.execute(insert(ProjectResult), [{"id": i, "project_id": i, "description": "r"} for i in ids])
+            await conn.execute(insert(ProjectResultImage), [
+                {"result_id": i, "type": t, "img": f"r{i}{t}.png"} for i in ids for t in ("tablet", "smartphone")
+            ])
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(Role), [{"id": i, "name": f"role{i}"} for i in range(1, 21)])
+        for start in range(0, users, batch_size):
+            ids = range(start + 1, min(users, start + batch_size) + 1)
+            await conn.execute(insert(User), [
+                {"id": i, "email": f"user{i}@example.com", "password_hash": "x", "role_ids": str(i % 20 + 1)} for i in ids
+            ])
+            await conn.execute(insert(user_roles), [{"user_id": i, "role_id": i % 20 + 1} for i in ids])
+        # Свежая статистика, иначе планировщик PostgreSQL считает таблицы маленькими
+        await conn.execute(text("ANALYZE"))
+
+
+@contextmanager
+def capture_statements(engine):
+    captured = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before)
+    try:
+        yield captured
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before)
+
+
+async def scenarios(projects, users):
+    from app.models import User
+    from app.projects import (fetch_project_page, fetch_project_list_validators, fetch_full_project,
+                              DEFAULT_PROJECT_LIST_FIELDS)
+    from app.admin import count_role_users
+
+    async def list_first_page(session):
+        return await fetch_project_page(session, DEFAULT_PROJECT_LIST_FIELDS, 20)
+
+    async def list_next_page(session):
+        page = await fetch_project_page(session, DEFAULT_PROJECT_LIST_FIELDS, 20)
+        return await fetch_project_page(session, DEFAULT_PROJECT_LIST_FIELDS, 20, page["next_cursor"])
+
+    async def list_validators(session):
+        page = await fetch_project_page(session, DEFAULT_PROJECT_LIST_FIELDS, 20)
+        return await fetch_project_list_validators(session, 20, page["next_cursor"])
+
+    async def full_project(session):
+        return await fetch_full_project(session, projects // 2 + 1)
+
+    async def user_by_email(session):
+        return (await session.execute(select(User).where(User.email == f"user{users // 2 + 1}@example.com"))).scalar_one_or_none()
+
+    async def users_with_role(session):
+        return await count_role_users(session, 7)
+
+    async def user_has_role(session):
+        user = await session.get(User, users // 2 + 1)
+        return await user.has_role(session, 7)
+
+    return {
+        "list: первая страница": list_first_page,
+        "list: страница по курсору": list_next_page,
+        "list: ETag страницы по курсору": list_validators,
+        "полный проект": full_project,
+        "пользователь по email": user_by_email,
+        "пользователи роли": users_with_role,
+        "проверка роли": user_has_role,
+    }
+
+
+def seq_scans(dialect, plan_rows):
+    """Строки плана с полным проходом по таблице"""
+    if dialect == "sqlite":
+        # SCAN с индексом (USING INDEX / COVERING INDEX) — проход по индексу, это нормально
+        return [row for row in plan_rows
+                if row.startswith("SCAN ") and " USING " not in row and row != "SCAN CONSTANT ROW"]
+    found = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            found.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan_rows[0]["Plan"])
+    return found
+
+
+async def explain(conn, statement, parameters):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        rows = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+        plan = [row[-1] for row in rows]
+        return plan, plan
+    raw = (await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)).scalar()
+    plan = json.loads(raw) if isinstance(raw, str) else raw
+    return plan, [json.dumps(plan[0]["Plan"], ensure_ascii=False)[:300]]
+
+
+async def main(args):
+    from app.database import engine, SessionLocal
+
+    print(f"Заполнение: {args.projects} проектов, {args.users} пользователей...")
+    await seed(args.projects, args.users)
+
+    failures = 0
+    for name, scenario in (await scenarios(args.projects, args.users)).items():
+        with capture_statements(engine) as captured:
+            async with SessionLocal() as session:
+                await scenario(session)
+        print(f"\n== {name}")
+        async with engine.connect() as conn:
+            for statement, parameters in captured:
+                plan, printable = await explain(conn, statement, parameters)
+                scans = seq_scans(conn.dialect.name, plan)
+                print("  " + " ".join(statement.split())[:140])
+                for line in printable:
+                    print(f"    {line}")
+                if scans:
+                    failures += 1
+                    print(f"    !! полный проход: {', '.join(scans)}")
+
+    print(f"\n{'OK' if not failures else f'Найдено полных проходов: {failures}'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    sys.exit(asyncio.run(main(parser.parse_args())))